@@ -0,0 +1,3 @@
+
+
+2.0ĳ
\ No newline at end of file
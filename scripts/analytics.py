@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""Revenue vehicle-km, service hours and trips per route, day and month.
+
+Shape lengths are measured once, with haversine over the full-resolution
+shape coordinates; trips without a shape are measured stop to stop. Each
+trip's length and running time are weighted by its runs per service day
+(more than one for frequency-based trips), and joined with the expanded
+service calendar through one matrix product per metric, so a window of
+any length costs the same few array operations.
+
+    python analytics.py                      # totals per route and month
+    python analytics.py -o reports/          # also daily.csv and monthly.csv
+    python analytics.py --start 20250901 --end 20260831
+"""
+
+import csv
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import gen_gtfs
+from linear_ref import cumulative_distance, haversine
+from service_calendar import to_day, to_yyyymmdd
+
+METRICS = ("trips", "vehicle_km", "service_hours")
+
+
+def shape_lengths():
+    """{shape_id: length in km} of every shape, at full resolution."""
+    return {
+        shape_id: cumulative_distance(coords[:, :2])[-1] / 1000
+        for shape_id, coords in gen_gtfs.raw_shapes().items()
+    }
+
+
+def pattern_lengths(expanded):
+    """Revenue km of each pattern: its shape, or its stops joined by straight lines."""
+    lengths = shape_lengths()
+    stops = gen_gtfs.get_stop_lookup()
+    result = np.zeros(len(expanded.patterns))
+    for p, pattern in enumerate(expanded.patterns):
+        if pattern.get("shape_id") in lengths:
+            result[p] = lengths[pattern["shape_id"]]
+        else:
+            stop_ids = expanded.stop_ids[expanded.pattern_stops(p)]
+            lonlat = np.array([stops[s] for s in stop_ids])
+            result[p] = haversine(lonlat[:-1], lonlat[1:]).sum() / 1000
+    return result
+
+
+class ServiceAnalytics:
+    """Per-route, per-day service totals over the feed window.
+
+    days    datetime64[D] days of the window
+    routes  route_ids, in ROUTES order
+    daily   {metric: (routes, days) array} for each of METRICS
+    """
+
+    def __init__(self, start=None, end=None):
+        expanded = gen_gtfs.expanded_trips()
+        calendar = gen_gtfs.service_calendar()
+        self.routes = [route["route_id"] for route in gen_gtfs.ROUTES]
+
+        # Per trip: runs per service day, revenue km and hours of one run
+        times = expanded.stop_times["time"]
+        trip = expanded.stop_times["trip"]
+        first = np.flatnonzero(expanded.stop_times["stop_sequence"] == 0)
+        last = np.append(first[1:], len(trip)) - 1
+        hours = (times[last] - times[first]) / 3600
+        km = pattern_lengths(expanded)[expanded.trip_pattern]
+        runs = np.bincount(
+            [t for t, _, _ in expanded.runs()], minlength=len(expanded.trips)
+        )
+
+        # (routes, trips) weights, and the (trips, days) days each trip runs
+        route_of = np.array([self.routes.index(t["route_id"]) for t in expanded.trips])
+        service_of = np.array(
+            [calendar.service_ids.index(t["service_id"]) for t in expanded.trips]
+        )
+        weights = np.zeros((len(self.routes), len(expanded.trips)))
+        weights[route_of, np.arange(len(expanded.trips))] = runs
+
+        start = calendar.start if start is None else max(start, calendar.start)
+        end = calendar.end if end is None else min(end, calendar.end)
+        window = slice(*np.searchsorted(calendar.days, [start, end + 1]))
+        self.days = calendar.days[window]
+        active = calendar.matrix()[service_of][:, window].astype(float)
+        self.daily = {
+            "trips": weights @ active,
+            "vehicle_km": (weights * km) @ active,
+            "service_hours": (weights * hours) @ active,
+        }
+
+    def monthly(self):
+        """(months as datetime64[M], {metric: (routes, months) array})."""
+        months = self.days.astype("datetime64[M]")
+        unique, starts = np.unique(months, return_index=True)
+        return unique, {
+            metric: np.add.reduceat(values, starts, axis=1)
+            for metric, values in self.daily.items()
+        }
+
+    def totals(self):
+        """{metric: per-route totals over the window}."""
+        return {metric: values.sum(axis=1) for metric, values in self.daily.items()}
+
+
+def _rows(periods, routes, values):
+    """Long-format rows, one per route and period with any service."""
+    route_index, period_index = np.nonzero(values["trips"])
+    for r, i in zip(route_index.tolist(), period_index.tolist()):
+        yield {
+            "period": periods[i],
+            "route_id": routes[r],
+            "trips": int(round(values["trips"][r, i])),
+            "vehicle_km": round(float(values["vehicle_km"][r, i]), 1),
+            "service_hours": round(float(values["service_hours"][r, i]), 2),
+        }
+
+
+def write_report(analytics, output):
+    """Write daily.csv and monthly.csv to the directory output."""
+    output.mkdir(parents=True, exist_ok=True)
+    months, monthly = analytics.monthly()
+    reports = {
+        "daily.csv": ("date", to_yyyymmdd(analytics.days).tolist(), analytics.daily),
+        "monthly.csv": ("month", [str(m) for m in months], monthly),
+    }
+    for filename, (period, periods, values) in reports.items():
+        with open(output / filename, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(
+                f, [period, "route_id", *METRICS], lineterminator="\n"
+            )
+            writer.writeheader()
+            writer.writerows(
+                {period: row.pop("period"), **row}
+                for row in _rows(periods, analytics.routes, values)
+            )
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Service totals per route and month.")
+    parser.add_argument("--start", type=to_day, help="first day, YYYYMMDD")
+    parser.add_argument("--end", type=to_day, help="last day, YYYYMMDD")
+    parser.add_argument(
+        "-o", "--output", type=Path, help="also write daily.csv and monthly.csv here"
+    )
+    args = parser.parse_args(argv)
+
+    analytics = ServiceAnalytics(args.start, args.end)
+    months, monthly = analytics.monthly()
+    header = " ".join(f"{m:>14}" for m in METRICS)
+
+    def line(label, values):
+        trips, km, hours = values
+        return f"{label:<8} {trips:>14.0f} {km:>14.1f} {hours:>14.1f}"
+
+    print(f"{'month':<8} {header}")
+    for i, month in enumerate(months):
+        print(line(str(month), [monthly[m][:, i].sum() for m in METRICS]))
+    totals = analytics.totals()
+    print(f"\n{'route':<8} {header}")
+    for r, route_id in enumerate(analytics.routes):
+        print(line(route_id, [totals[m][r] for m in METRICS]))
+
+    if args.output:
+        write_report(analytics, args.output)
+        print(f"{args.output}: updated", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+"""Benchmarks of gen_gtfs.py on synthetic feeds scaled up from the real one.
+
+A feed at scale N has N shifted copies of every stop, shape and trip
+pattern, so trips, stops and shape vertices all grow N times. Each scale is
+built in fresh processes, --repeats times plainly, for the end-to-end time
+and peak RSS, and as many times with --profile, for the time of each table.
+Each time is the fastest of its repeats, and its spread is how much slower
+the slowest one was.
+
+Results are compared with benchmark_baseline.json, and a metric that grew
+past its tolerance fails the run. So does an end-to-end metric that shrank
+as far below it, since the baseline no longer describes the build and
+should be saved again. The tolerance of a time is its larger spread, in the
+baseline or now, so a noisy machine loosens the check instead of failing it.
+
+    python benchmark.py                  # 10x and 100x against the baseline
+    python benchmark.py --repeats 9      # on a noisy machine
+    python benchmark.py --save           # make these results the baseline
+
+Timings depend on the machine, so refresh the baseline when it changes.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import gen_gtfs
+
+BASELINE = Path(gen_gtfs.script_dir) / "benchmark_baseline.json"
+
+DEFAULT_SCALES = [10, 100]
+DEFAULT_REPEATS = 5
+
+# Allowed growth over the baseline before a metric counts as a regression; for
+# times, the least allowed whatever the spread of their repeats
+TOLERANCE = {"build_s": 1.1, "peak_rss_mb": 1.15, "zip_bytes": 1.02, "table_s": 1.2}
+
+# Tables too quick to time reliably are not compared
+MIN_TABLE_S = 0.05
+
+# Degrees between copies of the feed, so copies never share a stop or shape
+COPY_STEP = (0.6, 0.4)
+COPIES_PER_ROW = 40
+
+
+def _shift(k):
+    return COPY_STEP[0] * (k % COPIES_PER_ROW), COPY_STEP[1] * (k // COPIES_PER_ROW)
+
+
+def _copy_id(value, k):
+    return value if k == 0 else f"{value}-{k}"
+
+
+def synthetic_feed(scale, data_dir):
+    """Write stops.geojson and shapes/ for scale copies of the feed to data_dir.
+
+    Returns the trip patterns of the copies, and their sizes.
+    """
+    data_dir = Path(data_dir)
+    (data_dir / "shapes").mkdir(parents=True, exist_ok=True)
+
+    stops = gen_gtfs.load_stops()
+    features = []
+    for k in range(scale):
+        dlon, dlat = _shift(k)
+        features.extend(
+            {
+                "type": "Feature",
+                "properties": {
+                    "stop_id": _copy_id(stop["stop_id"], k),
+                    "stop_name": _copy_id(stop["stop_name"], k),
+                    "stop_desc": stop["stop_desc"],
+                },
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [
+                        round(stop["stop_lon"] + dlon, 6),
+                        round(stop["stop_lat"] + dlat, 6),
+                    ],
+                },
+            }
+            for stop in stops
+        )
+    with open(data_dir / "stops.geojson", "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+    vertices = 0
+    for shape_id in gen_gtfs.shape_ids():
+        coords = gen_gtfs._coords(gen_gtfs.shape_path(shape_id)).tolist()
+        vertices += len(coords) * scale
+        for k in range(scale):
+            dlon, dlat = _shift(k)
+            line = [[round(c[0] + dlon, 6), round(c[1] + dlat, 6), *c[2:]] for c in coords]
+            with open(
+                data_dir / "shapes" / f"{_copy_id(shape_id, k)}.geojson",
+                "w",
+                encoding="utf-8",
+            ) as f:
+                json.dump(
+                    {
+                        "type": "FeatureCollection",
+                        "features": [
+                            {
+                                "type": "Feature",
+                                "properties": {},
+                                "geometry": {"type": "LineString", "coordinates": line},
+                            }
+                        ],
+                    },
+                    f,
+                )
+
+    patterns = [
+        {
+            **pattern,
+            "trip_id": _copy_id(pattern["trip_id"], k),
+            **(
+                {"shape_id": _copy_id(pattern["shape_id"], k)}
+                if "shape_id" in pattern
+                else {}
+            ),
+            "stop_times": [
+                (time_, _copy_id(stop_id, k)) for time_, stop_id in pattern["stop_times"]
+            ],
+        }
+        for k in range(scale)
+        for pattern in gen_gtfs.TRIP_PATTERNS
+    ]
+    sizes = {
+        "trip_patterns": len(patterns),
+        "stops": len(features),
+        "shape_vertices": vertices,
+    }
+    return patterns, sizes
+
+
+def _run_child(data_dir, args):
+    """Run gen_gtfs on the feed in data_dir; returns (seconds, peak RSS in MB, status)."""
+    started = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, __file__, "--child", str(data_dir), *args],
+        stdout=subprocess.DEVNULL,
+    )
+    _, status, usage = os.wait4(child.pid, 0)
+    seconds = time.perf_counter() - started
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return seconds, rss, os.waitstatus_to_exitcode(status)
+
+
+def child(data_dir, args):
+    """Build the synthetic feed in data_dir with gen_gtfs's command line."""
+    with open(Path(data_dir) / "patterns.json", encoding="utf-8") as f:
+        gen_gtfs.TRIP_PATTERNS[:] = json.load(f)
+    gen_gtfs.DATA_DIR = str(data_dir)
+    return gen_gtfs.main(args)
+
+
+def _timing(entry, key, times):
+    """Store the fastest of times under key, and their spread under key_spread."""
+    fastest = min(times)
+    entry[key] = round(fastest, 6)
+    entry[f"{key}_spread"] = round(max(times) / fastest - 1 if fastest else 0, 3)
+
+
+def run_scale(scale, repeats=DEFAULT_REPEATS):
+    """Benchmark results of the feed at scale, over repeats builds of each kind."""
+    with tempfile.TemporaryDirectory(prefix=f"gtfs-bench-{scale}x-") as tmp:
+        tmp = Path(tmp)
+        patterns, result = synthetic_feed(scale, tmp)
+        with open(tmp / "patterns.json", "w", encoding="utf-8") as f:
+            json.dump(patterns, f)
+
+        common = ["-o", str(tmp / "feed.zip"), "--no-cache", "--no-sidecar"]
+        builds = []
+        for _ in range(repeats):
+            seconds, rss, code = _run_child(tmp, common)
+            if code != 0:
+                return {**result, "failed": f"exit status {code}"}
+            builds.append((seconds, rss))
+        _timing(result, "build_s", [seconds for seconds, _ in builds])
+        result["peak_rss_mb"] = round(max(rss for _, rss in builds), 1)
+        result["zip_bytes"] = (tmp / "feed.zip").stat().st_size
+
+        # Unvalidated, so each table is built as it is written and timed there
+        profile = tmp / "profile.json"
+        steps = {}
+        for _ in range(repeats):
+            _run_child(tmp, common + ["--no-validate", "--profile", str(profile)])
+            for phase in json.loads(profile.read_text())["phases"]:
+                if "table" in phase:
+                    step, _ = phase["phase"].split(" ", 1)
+                    key = (phase["table"], phase["rows"], f"{step}_s")
+                    steps.setdefault(key, []).append(phase["wall_s"])
+        tables = {}
+        for (table, rows, step), times in steps.items():
+            _timing(tables.setdefault(table, {"rows": rows}), step, times)
+        result["repeats"] = repeats
+        result["tables"] = tables
+        return result
+
+
+def compare(results, baseline):
+    """Lines describing each metric against the baseline, and the failing metrics."""
+    lines, failures = [], []
+
+    def check(label, value, before, tolerance, stale=True):
+        ratio = value / before if before else float("inf")
+        tolerance = round(tolerance, 2)
+        flag = ""
+        if ratio > tolerance:
+            flag = "  REGRESSION"
+            failures.append(label)
+        elif stale and ratio < 1 / tolerance:
+            # An improvement this large would hide later regressions up to it
+            flag = "  BASELINE STALE"
+            failures.append(label)
+        lines.append(
+            f"{label:<40} {before:>12} {value:>12} {ratio:>6.2f}x"
+            f" {tolerance:>6.2f}x{flag}"
+        )
+
+    def spread(key, *entries):
+        return 1 + max(entry.get(f"{key}_spread", 0) for entry in entries)
+
+    for scale, result in results.items():
+        before = baseline.get(scale)
+        if before is None or "failed" in result or "failed" in before:
+            lines.append(f"{scale}x: {result.get('failed', 'no baseline to compare')}")
+            continue
+        check(
+            f"{scale}x build_s",
+            result["build_s"],
+            before["build_s"],
+            max(TOLERANCE["build_s"], spread("build_s", result, before)),
+        )
+        for metric in ("peak_rss_mb", "zip_bytes"):
+            check(
+                f"{scale}x {metric}", result[metric], before[metric], TOLERANCE[metric]
+            )
+        for table, entry in result["tables"].items():
+            old = before["tables"].get(table, {})
+            for step in ("build_s", "write_s"):
+                if step in entry and old.get(step, 0) >= MIN_TABLE_S:
+                    check(
+                        f"{scale}x {table} {step}",
+                        entry[step],
+                        old[step],
+                        max(TOLERANCE["table_s"], spread(step, entry, old)),
+                        # Profiled table times vary too much to bound from below
+                        stale=False,
+                    )
+    return lines, failures
+
+
+def main(argv=None):
+    import argparse
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--child"]:
+        return child(argv[1], argv[2:])
+
+    parser = argparse.ArgumentParser(description="Benchmark gen_gtfs.py on scaled-up feeds.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=DEFAULT_REPEATS,
+        help=f"builds of each kind per scale, at least {DEFAULT_REPEATS} (the default)",
+    )
+    parser.add_argument("--save", action="store_true", help="write the results as the baseline")
+    parser.add_argument("-o", "--output", type=Path, help="also write the results as JSON")
+    args = parser.parse_args(argv)
+    if args.repeats < DEFAULT_REPEATS:
+        parser.error(f"--repeats must be at least {DEFAULT_REPEATS} to measure a spread")
+
+    results = {}
+    for scale in args.scales:
+        print(f"{scale}x ...", file=sys.stderr)
+        results[str(scale)] = run_scale(scale, args.repeats)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if args.save:
+        baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+        baseline.update(results)
+        BASELINE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"{BASELINE}: updated", file=sys.stderr)
+        return 0
+
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    lines, failures = compare(results, baseline)
+    print(f"{'metric':<40} {'baseline':>12} {'now':>12} {'ratio':>7} {'limit':>7}")
+    print("\n".join(lines))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+"""Columnar binary sidecar of the GTFS feed, readable without parsing.
+
+The sidecar is derived from the text tables in the zip, which stay the
+canonical output. Each column is a little-endian array at an aligned offset
+in one file; IDs are interned into string tables and referenced by int32
+index, times are int32 seconds and coordinates int32 millionths of a
+degree. BinaryFeed memory-maps the file and returns numpy views into it.
+
+Layout:
+    8 bytes   magic b"WGTFSBIN"
+    uint32    format version
+    uint32    length of the JSON directory
+    uint64    offset of the first array
+    JSON      directory: {"arrays": {name: {"dtype", "shape", "offset"}}}
+    arrays    each starting on an ALIGN-byte boundary
+"""
+
+import csv
+import io
+import json
+import os
+import struct
+import sys
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from trip_patterns import parse_time
+
+MAGIC = b"WGTFSBIN"
+VERSION = 1
+ALIGN = 64
+HEADER = struct.Struct("<8sIIQ")
+
+# Coordinates are stored as int32 multiples of 1 / COORD_SCALE degrees
+COORD_SCALE = 1_000_000
+
+# Interned ID columns: table column -> string table
+ID_COLUMNS = {
+    "stop_id": "stop_id",
+    "trip_id": "trip_id",
+    "route_id": "route_id",
+    "service_id": "service_id",
+    "shape_id": "shape_id",
+}
+
+# Typed columns of each table; ids are interned, the rest converted by kind
+TABLES = {
+    "stops.txt": {"stop_id": "id", "stop_lat": "coord", "stop_lon": "coord"},
+    "trips.txt": {
+        "trip_id": "id",
+        "route_id": "id",
+        "service_id": "id",
+        "shape_id": "id",
+        "direction_id": "int8",
+    },
+    "stop_times.txt": {
+        "trip_id": "id",
+        "stop_id": "id",
+        "stop_sequence": "int32",
+        "arrival_time": "time",
+        "departure_time": "time",
+        "shape_dist_traveled": "float32",
+    },
+    "shapes.txt": {
+        "shape_id": "id",
+        "shape_pt_sequence": "int32",
+        "shape_pt_lat": "coord",
+        "shape_pt_lon": "coord",
+        "shape_dist_traveled": "float32",
+    },
+}
+
+
+def _convert(kind, values, interned):
+    if kind == "id":
+        return np.array([interned.setdefault(v, len(interned)) for v in values], np.int32)
+    if kind == "time":
+        return np.array([parse_time(v) if v else -1 for v in values], np.int32)
+    if kind == "coord":
+        return np.round(np.array(values, dtype=float) * COORD_SCALE).astype(np.int32)
+    if kind == "float32":
+        return np.array([v if v != "" else "nan" for v in values], dtype=np.float32)
+    return np.array(values, dtype=kind)
+
+
+def _string_table(values):
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def build_arrays(zip_path):
+    """Columns of the feed at zip_path, keyed "table/column" and "ids/name/..."."""
+    arrays = {}
+    interned = {name: {} for name in dict.fromkeys(ID_COLUMNS.values())}
+    with zipfile.ZipFile(zip_path) as zf:
+        for filename, columns in TABLES.items():
+            if filename not in zf.namelist():
+                continue
+            with zf.open(filename) as f:
+                reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
+                rows = list(reader)
+            table = filename.removesuffix(".txt")
+            for column, kind in columns.items():
+                if column not in reader.fieldnames:
+                    continue
+                values = [row[column] for row in rows]
+                arrays[f"{table}/{column}"] = _convert(
+                    kind, values, interned.get(ID_COLUMNS.get(column))
+                )
+
+    for name, ids in interned.items():
+        offsets, data = _string_table(list(ids))
+        arrays[f"ids/{name}/offsets"] = offsets
+        arrays[f"ids/{name}/data"] = data
+    return arrays
+
+
+def write(arrays, output):
+    """Write arrays to output in the sidecar layout; returns whether it changed."""
+    # Little-endian copies, leaving the caller's arrays as they were
+    arrays = {
+        name: np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+        for name, array in arrays.items()
+    }
+    directory, offset = {}, 0
+    for name, array in arrays.items():
+        directory[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    meta = json.dumps({"arrays": directory}, sort_keys=True).encode("utf-8")
+    data_start = -(-(HEADER.size + len(meta)) // ALIGN) * ALIGN
+
+    buf = bytearray(data_start + offset)
+    buf[: HEADER.size] = HEADER.pack(MAGIC, VERSION, len(meta), data_start)
+    buf[HEADER.size : HEADER.size + len(meta)] = meta
+    for name, array in arrays.items():
+        start = data_start + directory[name]["offset"]
+        buf[start : start + array.nbytes] = array.tobytes()
+
+    output = Path(output)
+    if output.exists() and output.read_bytes() == buf:
+        return False
+    tmp_path = output.with_name(f"{output.name}.tmp")
+    tmp_path.write_bytes(buf)
+    os.replace(tmp_path, output)
+    return True
+
+
+class StringTable:
+    """Interned IDs, decoded one at a time from the mapped bytes."""
+
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+        self._index = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self._data[self._offsets[i] : self._offsets[i + 1]]).decode("utf-8")
+
+    def index(self, value):
+        """Index of value, building the reverse lookup on first use."""
+        if self._index is None:
+            self._index = {self[i]: i for i in range(len(self))}
+        return self._index[value]
+
+
+class BinaryFeed:
+    """Zero-copy access to a sidecar file through numpy views of a memory map."""
+
+    def __init__(self, path):
+        self._buf = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, meta_len, self._data_start = HEADER.unpack(
+            bytes(self._buf[: HEADER.size])
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} feed sidecar")
+        meta = bytes(self._buf[HEADER.size : HEADER.size + meta_len])
+        self.directory = json.loads(meta)["arrays"]
+
+    def array(self, name):
+        info = self.directory[name]
+        return np.frombuffer(
+            self._buf,
+            dtype=info["dtype"],
+            count=int(np.prod(info["shape"])),
+            offset=self._data_start + info["offset"],
+        ).reshape(info["shape"])
+
+    def table(self, table):
+        """Columns of a table, e.g. "stop_times", as a dict of arrays."""
+        prefix = f"{table}/"
+        return {
+            name.removeprefix(prefix): self.array(name)
+            for name in self.directory
+            if name.startswith(prefix)
+        }
+
+    def ids(self, name):
+        """String table of an interned ID, e.g. "stop_id"."""
+        return StringTable(
+            self.array(f"ids/{name}/offsets"), self.array(f"ids/{name}/data")
+        )
+
+    @property
+    def stop_times(self):
+        return self.table("stop_times")
+
+    @property
+    def shapes(self):
+        return self.table("shapes")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write the binary sidecar of a feed.")
+    parser.add_argument("zip_path", type=Path)
+    parser.add_argument("output", type=Path, nargs="?")
+    args = parser.parse_args(argv)
+
+    output = args.output or args.zip_path.with_suffix(".bin")
+    changed = write(build_arrays(args.zip_path), output)
+    print(f"{output}: {'updated' if changed else 'unchanged'}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
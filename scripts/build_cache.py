@@ -0,0 +1,87 @@
+"""Content-addressed cache of built GTFS tables.
+
+Each table is stored as the CSV text that goes into the feed, under a key
+derived from the digests of everything it was built from: its data files
+and constants, and the source of the code that builds it. A table whose
+inputs have not changed is reused instead of being rebuilt. The validation
+report of the whole feed is kept the same way, as JSON. After a full build,
+prune() removes the entries it did not use.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+
+# Layout of the cache directory, part of every key
+CACHE_VERSION = 3
+
+
+def file_digest(path):
+    """sha256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def value_digest(value):
+    """sha256 of a JSON-serialisable value, independent of dict ordering."""
+    data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def source_digest(code):
+    """sha256 of the source of a module, or of a function or class."""
+    if inspect.ismodule(code):
+        return file_digest(code.__file__)
+    return value_digest(inspect.getsource(code))
+
+
+class BuildCache:
+    """Directory of rendered tables keyed by the digests of their inputs."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._used = set()
+
+    def key(self, filename, inputs):
+        return value_digest([CACHE_VERSION, filename, list(inputs)])
+
+    def path(self, key, suffix=".csv"):
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def get_or_build(self, filename, inputs, render, suffix=".csv"):
+        """Return the cached file for filename, calling render(path) on a miss.
+
+        Returns a (path, hit) pair.
+        """
+        path = self.path(self.key(filename, inputs), suffix)
+        self._used.add(path)
+        if path.exists():
+            return path, True
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            render(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return path, False
+
+    def prune(self):
+        """Remove every entry not returned by get_or_build(); returns how many."""
+        removed = 0
+        for path in self.root.glob("*/*"):
+            # .tmp files belong to builds still running
+            if path not in self._used and path.suffix != ".tmp":
+                path.unlink()
+                removed += 1
+        for directory in self.root.glob("*"):
+            if directory.is_dir() and not any(directory.iterdir()):
+                directory.rmdir()
+        return removed
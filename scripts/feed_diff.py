@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+"""Structural diff of two GTFS zips, table by table.
+
+Rows are matched on their GTFS primary key and stored only as two short
+hashes, one of every column and one of the columns riders see, so the
+tables are streamed rather than held in memory. Changed rows are re-read
+through the FeedReader index to describe them. Calendars are compared as
+the days each service runs, and shapes geometrically, within a tolerance;
+shapes.txt is the one table decoded whole, once per feed.
+
+Exits with status 1 when riders would see a difference, so it can gate a
+deploy.
+
+    python feed_diff.py old/west_gtfs.zip ../west_gtfs.zip --json diff.json
+"""
+
+import hashlib
+import json
+import sys
+
+import numpy as np
+
+from feed_reader import MISSING, TIME_COLUMNS, FeedReader
+from service_calendar import ServiceCalendar, to_yyyymmdd
+from segment_index import SegmentIndex
+from simplify import project
+
+# Primary key of each table compared row by row. Shape points are also
+# compared as geometry, which is what decides whether riders see a change.
+KEYS = {
+    "agency.txt": ["agency_id"],
+    "stops.txt": ["stop_id"],
+    "routes.txt": ["route_id"],
+    "trips.txt": ["trip_id"],
+    "stop_times.txt": ["trip_id", "stop_sequence"],
+    "frequencies.txt": ["trip_id", "start_time"],
+    "shapes.txt": ["shape_id", "shape_pt_sequence"],
+    "feed_info.txt": [],
+}
+
+# Columns whose changes riders see; tables without an entry are not rider-visible
+RIDER_COLUMNS = {
+    "agency.txt": ["agency_name", "agency_url", "agency_timezone", "agency_phone"],
+    "stops.txt": ["stop_name", "stop_lat", "stop_lon", "wheelchair_boarding"],
+    "routes.txt": [
+        "route_short_name",
+        "route_long_name",
+        "route_type",
+        "route_color",
+        "route_text_color",
+    ],
+    "trips.txt": [
+        "route_id",
+        "service_id",
+        "trip_headsign",
+        "direction_id",
+        "wheelchair_accessible",
+        "bikes_allowed",
+    ],
+    "stop_times.txt": [
+        "arrival_time",
+        "departure_time",
+        "stop_id",
+        "pickup_type",
+        "drop_off_type",
+    ],
+    "frequencies.txt": ["end_time", "headway_secs", "exact_times"],
+}
+
+# Shapes closer than this everywhere count as unchanged
+SHAPE_TOLERANCE_M = 5.0
+
+# Rows described per table and kind of change
+MAX_EXAMPLES = 10
+
+
+def _digest(values):
+    return hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=8).digest()
+
+
+def _row_hashes(table):
+    """Stream (key, all-columns hash, rider-columns hash) for each row of table.
+
+    Values are typed before hashing, so 8:40:00 equals 08:40:00.
+    """
+    key_columns = KEYS[table.name]
+    rider = RIDER_COLUMNS.get(table.name, [])
+    for row in table.rows(typed=True):
+        values = {k: repr(v) for k, v in row.items() if k is not None}
+        yield (
+            tuple(row.get(c) for c in key_columns),
+            _digest(f"{k}={v}" for k, v in sorted(values.items())),
+            _digest(values.get(c, "") for c in rider),
+        )
+
+
+def _readable(column, value):
+    if column in TIME_COLUMNS and value != MISSING:
+        return f"{value // 3600:02d}:{value // 60 % 60:02d}:{value % 60:02d}"
+    return value
+
+
+def _fetch(table, key):
+    """The typed row of table with the given primary key, or an empty dict."""
+    if table is None:
+        return {}
+    key_columns = KEYS[table.name]
+    if not key_columns:
+        return next(table.rows(typed=True), {})
+    for row in table.where(key_columns[0], key[0]):
+        if tuple(row.get(c) for c in key_columns) == key:
+            return row
+    return {}
+
+
+def diff_table(old, new, name):
+    """Added, removed and changed rows of one table."""
+    old_table = old[name] if name in old else None
+    new_table = new[name] if name in new else None
+    # Only the old table's hashes are held; the new one is streamed past them
+    before = {}
+    if old_table:
+        before = {key: (full, rider) for key, full, rider in _row_hashes(old_table)}
+    added, changed, counts = [], [], {"added": 0, "changed": 0}
+    rider_changed = False
+    for key, full, rider in _row_hashes(new_table) if new_table else ():
+        old_hashes = before.pop(key, None)
+        if old_hashes is None:
+            kind = "added"
+        elif old_hashes[0] != full:
+            kind = "changed"
+            rider_changed = rider_changed or old_hashes[1] != rider
+        else:
+            continue
+        counts[kind] += 1
+        if counts[kind] <= MAX_EXAMPLES:
+            (added if kind == "added" else changed).append(key)
+    removed = list(before)
+
+    def describe(key):
+        a, b = _fetch(old_table, key), _fetch(new_table, key)
+        return {
+            "key": list(key),
+            "columns": {
+                c: [_readable(c, a.get(c)), _readable(c, b.get(c))]
+                for c in dict.fromkeys([*a, *b])
+                if repr(a.get(c)) != repr(b.get(c))
+            },
+        }
+
+    return {
+        "added": counts["added"],
+        "removed": len(removed),
+        "changed": counts["changed"],
+        "rider_visible": name in RIDER_COLUMNS
+        and bool(added or removed or rider_changed),
+        "examples": {
+            "added": [list(k) for k in added],
+            "removed": [list(k) for k in removed[:MAX_EXAMPLES]],
+            "changed": [describe(k) for k in changed],
+        },
+    }
+
+
+def _service_days(feed):
+    """{service_id: array of YYYYMMDD days it runs}."""
+
+    def typed(name):
+        return list(feed[name].rows(typed=True)) if name in feed else []
+
+    calendar, calendar_dates = typed("calendar.txt"), typed("calendar_dates.txt")
+    dates = [r[k] for r in calendar for k in ("start_date", "end_date")]
+    dates += [r["date"] for r in calendar_dates]
+    if not dates:
+        return {}
+    services = ServiceCalendar(calendar, calendar_dates, min(dates), max(dates))
+    days = to_yyyymmdd(services.days)
+    return {s: days[row] for s, row in zip(services.service_ids, services.matrix())}
+
+
+def diff_calendar(old, new):
+    """Days added to and removed from each service, keyed on service_id and date."""
+    before, after = _service_days(old), _service_days(new)
+    services = {}
+    for service_id in dict.fromkeys([*before, *after]):
+        a = before.get(service_id, np.zeros(0, dtype=np.int64))
+        b = after.get(service_id, np.zeros(0, dtype=np.int64))
+        added, removed = np.setdiff1d(b, a), np.setdiff1d(a, b)
+        if len(added) or len(removed):
+            services[service_id] = {
+                "added": len(added),
+                "removed": len(removed),
+                "examples": {
+                    "added": added[:MAX_EXAMPLES].tolist(),
+                    "removed": removed[:MAX_EXAMPLES].tolist(),
+                },
+            }
+    return {"services": services, "rider_visible": bool(services)}
+
+
+def _shapes(feed):
+    """{shape_id: (n, 2) lon/lat array}, in the order shapes first appear.
+
+    shapes.txt is decoded once into columns and split by shape_id.
+    """
+    if "shapes.txt" not in feed:
+        return {}
+    columns = feed["shapes.txt"].arrays(
+        "shape_id", "shape_pt_sequence", "shape_pt_lon", "shape_pt_lat"
+    )
+    names, first, inverse = np.unique(
+        columns["shape_id"], return_index=True, return_inverse=True
+    )
+    order = np.lexsort((columns["shape_pt_sequence"], inverse))
+    points = np.column_stack((columns["shape_pt_lon"], columns["shape_pt_lat"]))
+    bounds = np.searchsorted(inverse[order], np.arange(len(names) + 1))
+    return {
+        names[i]: points[order[bounds[i] : bounds[i + 1]]] for i in np.argsort(first)
+    }
+
+
+def _max_offset(points, line):
+    """Largest distance in metres from points to the polyline line, on a local plane."""
+    if not len(line):
+        return np.inf
+    if len(line) == 1:
+        line = np.repeat(line, 2, axis=0)
+    return float(SegmentIndex(line).nearest_many(points).max(initial=0))
+
+
+def shape_distance(a, b):
+    """Symmetric Hausdorff distance in metres between two lon/lat polylines."""
+    if np.array_equal(a, b):
+        return 0.0
+    lat0 = np.concatenate((a[:, 1], b[:, 1])).mean()
+    xa, xb = project(a, lat0), project(b, lat0)
+    return max(_max_offset(xa, xb), _max_offset(xb, xa))
+
+
+def diff_shapes(old, new, tolerance_m=SHAPE_TOLERANCE_M):
+    """Shapes added, removed, or moved further than tolerance_m."""
+    before, after = _shapes(old), _shapes(new)
+    added = [s for s in after if s not in before]
+    removed = [s for s in before if s not in after]
+    changed = {}
+    for shape_id in [s for s in after if s in before]:
+        metres = shape_distance(before[shape_id], after[shape_id])
+        if metres > tolerance_m:
+            changed[shape_id] = round(metres, 1)
+    return {
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "tolerance_m": tolerance_m,
+        "rider_visible": bool(added or removed or changed),
+    }
+
+
+def diff(old_path, new_path, tolerance_m=SHAPE_TOLERANCE_M):
+    """Differences between two feed zips, with whether riders would notice."""
+    with FeedReader(old_path) as old, FeedReader(new_path) as new:
+        tables = {
+            name: diff_table(old, new, name)
+            for name in KEYS
+            if name in old or name in new
+        }
+        report = {
+            "tables": tables,
+            "calendar": diff_calendar(old, new),
+            "shapes": diff_shapes(old, new, tolerance_m),
+        }
+    report["rider_visible"] = (
+        any(t["rider_visible"] for t in tables.values())
+        or report["calendar"]["rider_visible"]
+        or report["shapes"]["rider_visible"]
+    )
+    return report
+
+
+def summary(report):
+    """Lines of a short human-readable summary."""
+    lines = []
+    for name, t in report["tables"].items():
+        if t["added"] or t["removed"] or t["changed"]:
+            mark = " (rider-visible)" if t["rider_visible"] else ""
+            lines.append(
+                f"{name}: {t['added']} added, {t['removed']} removed, "
+                f"{t['changed']} changed{mark}"
+            )
+    for service_id, days in report["calendar"]["services"].items():
+        lines.append(
+            f"service {service_id}: {days['added']} days added, "
+            f"{days['removed']} days removed"
+        )
+    shapes = report["shapes"]
+    for shape_id in shapes["added"]:
+        lines.append(f"shape {shape_id}: added")
+    for shape_id in shapes["removed"]:
+        lines.append(f"shape {shape_id}: removed")
+    for shape_id, metres in shapes["changed"].items():
+        lines.append(f"shape {shape_id}: moved up to {metres} m")
+    if not lines:
+        lines.append("no differences")
+    return lines
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare two GTFS feed zips.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=SHAPE_TOLERANCE_M,
+        metavar="METRES",
+        help="shapes closer than this count as unchanged (default: %(default)s)",
+    )
+    parser.add_argument("--json", metavar="FILE", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    report = diff(args.old, args.new, args.tolerance)
+    print("\n".join(summary(report)))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    return 1 if report["rider_visible"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
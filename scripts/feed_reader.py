@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+"""Lazy, random-access reading of a GTFS zip such as west_gtfs.zip.
+
+The archive is opened once. A table is only read when it is used: rows are
+streamed through zipfile, and columns are decoded into typed arrays on
+demand. An index on a column, such as stop_times by trip_id, records where
+each key's rows lie in the uncompressed table. Fetching one key then parses
+only its rows, though zipfile still inflates the bytes before them.
+
+Rows must not contain line breaks, which holds for every table this
+project writes.
+
+    python feed_reader.py ../west_gtfs.zip stop_times.txt trip_id WCCWB
+"""
+
+import csv
+import io
+import json
+import sys
+import zipfile
+
+import numpy as np
+
+from trip_patterns import parse_time
+
+# Typed columns; any other column is text
+INT_COLUMNS = {
+    "route_type",
+    "direction_id",
+    "bikes_allowed",
+    "wheelchair_accessible",
+    "wheelchair_boarding",
+    "location_type",
+    "stop_sequence",
+    "pickup_type",
+    "drop_off_type",
+    "timepoint",
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+    "start_date",
+    "end_date",
+    "date",
+    "exception_type",
+    "shape_pt_sequence",
+    "headway_secs",
+    "exact_times",
+    "feed_start_date",
+    "feed_end_date",
+}
+FLOAT_COLUMNS = {
+    "stop_lat",
+    "stop_lon",
+    "shape_pt_lat",
+    "shape_pt_lon",
+    "shape_dist_traveled",
+}
+# Times become seconds since midnight
+TIME_COLUMNS = {"arrival_time", "departure_time", "start_time", "end_time"}
+
+# Empty values in int and time columns
+MISSING = -1
+
+
+def convert(column, values):
+    """A list of CSV strings from column as a typed array."""
+    if column in INT_COLUMNS:
+        return np.array([int(v) if v else MISSING for v in values], dtype=np.int64)
+    if column in FLOAT_COLUMNS:
+        return np.array([v or "nan" for v in values], dtype=float)
+    if column in TIME_COLUMNS:
+        return np.array(
+            [parse_time(v) if v else MISSING for v in values], dtype=np.int64
+        )
+    return np.array(values, dtype=object)
+
+
+def convert_value(column, value):
+    """One CSV string from column as a typed Python value."""
+    if column in INT_COLUMNS:
+        return int(value) if value else MISSING
+    if column in FLOAT_COLUMNS:
+        return float(value) if value else float("nan")
+    if column in TIME_COLUMNS:
+        return parse_time(value) if value else MISSING
+    return value
+
+
+class Table:
+    """One table of a FeedReader, read only as far as it is used."""
+
+    def __init__(self, zf, name):
+        self._zf = zf
+        self.name = name
+        self._arrays = {}
+        self._indexes = {}
+        with self._open() as f:
+            self.columns = next(csv.reader(f))
+
+    def _open(self):
+        return io.TextIOWrapper(
+            self._zf.open(self.name), encoding="utf-8-sig", newline=""
+        )
+
+    def rows(self, typed=False):
+        """Stream the rows as dicts, of strings or, with typed, of typed values."""
+        with self._open() as f:
+            for row in csv.DictReader(f):
+                yield {k: convert_value(k, v) for k, v in row.items()} if typed else row
+
+    __iter__ = rows
+
+    def __len__(self):
+        if self._arrays:
+            return len(next(iter(self._arrays.values())))
+        lines, last = 0, b"\n"
+        with self._zf.open(self.name) as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                lines += chunk.count(b"\n")
+                last = chunk[-1:]
+        # Rows hold no line breaks, so each is one line; the last may lack its own
+        return max(lines + (last != b"\n") - 1, 0)
+
+    def arrays(self, *names):
+        """Typed arrays of the given columns, decoding the missing ones in one pass."""
+        missing = [n for n in names if n not in self._arrays]
+        if missing:
+            positions = [self.columns.index(n) for n in missing]
+            values = [[] for _ in missing]
+            with self._open() as f:
+                reader = csv.reader(f)
+                next(reader)
+                for row in reader:
+                    for out, i in zip(values, positions):
+                        out.append(row[i])
+            for name, column in zip(missing, values):
+                self._arrays[name] = convert(name, column)
+        return {n: self._arrays[n] for n in names}
+
+    def column(self, name):
+        """One column as a typed array."""
+        return self.arrays(name)[name]
+
+    def index(self, column):
+        """{key: [(start, end), ...]} byte ranges of the rows of each key.
+
+        Built with one pass over the raw lines, which only splits out the key.
+        """
+        if column not in self._indexes:
+            position = self.columns.index(column)
+            ranges = {}
+            with self._zf.open(self.name) as f:
+                offset = len(f.readline())
+                last_key = None
+                for line in f:
+                    if position == 0 and not line.startswith(b'"'):
+                        key = line.split(b",", 1)[0].rstrip(b"\r\n").decode("utf-8")
+                    else:
+                        key = next(csv.reader([line.decode("utf-8")]))[position]
+                    end = offset + len(line)
+                    if key == last_key:
+                        ranges[key][-1] = (ranges[key][-1][0], end)
+                    else:
+                        ranges.setdefault(key, []).append((offset, end))
+                    last_key, offset = key, end
+            self._indexes[column] = ranges
+        return self._indexes[column]
+
+    def keys(self, column):
+        """Distinct values of column, in the order they first appear."""
+        return list(self.index(column))
+
+    def where(self, column, value, typed=True):
+        """Rows whose column equals value, parsing only those rows via the index."""
+        ranges = self.index(column).get(value, [])
+        rows = []
+        with self._zf.open(self.name) as f:
+            for start, end in ranges:
+                f.seek(start)
+                text = f.read(end - start).decode("utf-8")
+                for row in csv.DictReader(io.StringIO(text), fieldnames=self.columns):
+                    rows.append(
+                        {k: convert_value(k, v) for k, v in row.items()} if typed else row
+                    )
+        return rows
+
+
+class FeedReader:
+    """The tables of a GTFS zip, each opened lazily as a Table."""
+
+    def __init__(self, path):
+        self.path = path
+        self._zf = zipfile.ZipFile(path)
+        self._tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._zf.close()
+
+    @property
+    def names(self):
+        return [n for n in self._zf.namelist() if n.endswith(".txt")]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __getitem__(self, name):
+        if name not in self._tables:
+            if name not in self:
+                raise KeyError(name)
+            self._tables[name] = Table(self._zf, name)
+        return self._tables[name]
+
+    def stop_times(self, trip_id):
+        """Stop times of one trip, in stop_sequence order."""
+        rows = self["stop_times.txt"].where("trip_id", trip_id)
+        return sorted(rows, key=lambda row: row["stop_sequence"])
+
+    def shape(self, shape_id):
+        """(n, 2) lon/lat array of one shape, in sequence order."""
+        rows = sorted(
+            self["shapes.txt"].where("shape_id", shape_id),
+            key=lambda row: row["shape_pt_sequence"],
+        )
+        return np.array([[r["shape_pt_lon"], r["shape_pt_lat"]] for r in rows]).reshape(-1, 2)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the rows of a feed table with a key.")
+    parser.add_argument("zip_path")
+    parser.add_argument("table", help="e.g. stop_times.txt")
+    parser.add_argument("column", help="e.g. trip_id")
+    parser.add_argument("value")
+    args = parser.parse_args(argv)
+
+    with FeedReader(args.zip_path) as feed:
+        rows = feed[args.table].where(args.column, args.value)
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,34 @@
 #!/usr/bin/env python3
 
-import calendar
+"""Generate the West's Transportation GTFS feed (west_gtfs.zip).
+
+Importing this module only defines the feed constants; every GTFS table in
+FILES is built the first time it is accessed. Run it as a script to build
+the whole feed or, with --only, a subset of its tables.
+"""
+
+import functools
+import inspect
+import json
 import os
 import shutil
-import tempfile
-import json
-import geojson
-from datetime import datetime
+import sys
+from collections.abc import Mapping
 from enum import Enum
 from pathlib import Path
 
-import pandas as pd
+from build_cache import BuildCache, file_digest, source_digest, value_digest
+from gtfs_writer import ZipFeedWriter, present_columns, write_csv
+from profiling import Profiler
 
 script_dir = os.path.dirname(os.path.realpath(__file__))
 feed_path = Path(script_dir).parent / "west_gtfs"
+CACHE_DIR = Path(script_dir) / ".gtfs_cache"
+# Holds stops.geojson and shapes/; benchmark.py points it at synthetic data
+DATA_DIR = script_dir
 
-now = datetime.now()
+# Records the phases of a run once started, as main() does with --profile
+PROFILER = Profiler()
 
 
 class RouteTypes(Enum):
@@ -55,10 +68,10 @@ class ServiceException(Enum):
 
 
 def _coords(fp):
-    """Helper to open fp and return its first feature’s LineString coords."""
-    with open(fp, "r", encoding="utf-8") as f:
-        fc = geojson.load(f)
-    return fc.features[0].geometry.coordinates
+    """Coordinates of the one LineString in the GeoJSON file fp, as an array."""
+    from shape_reader import read_line
+
+    return read_line(fp)
 
 
 AGENCY_ID = "WT"
@@ -171,7 +184,10 @@ ROUTES = [
     },
 ]
 
-TRIPS = [
+# Each entry is a trip pattern (see trip_patterns.py): its stop_times give the
+# stop order and the times of one run, and optional "starts" or "frequencies"
+# add more runs with the same running times. TRIPS lists the expanded trips.
+TRIP_PATTERNS = [
     {
         "route_id": WEST_COASTAL_CONNECTION_ID,
         "service_id": DAILY_SERVICE_ID,
@@ -344,8 +360,8 @@ TRIPS = [
         "direction_id": DirectionId.INBOUND.value,
         "bikes_allowed": BikesAllowed.YES.value,
         "stop_times": [
-            ("8:45", "STOP-421bb314-1894-4c15-bb6f-0fec17fcb7d9"),
-            ("9:30", "STOP-477b3ace-4389-47e8-a4c7-cb32cd874a10"),
+            ("08:45", "STOP-421bb314-1894-4c15-bb6f-0fec17fcb7d9"),
+            ("09:30", "STOP-477b3ace-4389-47e8-a4c7-cb32cd874a10"),
         ],
     },
     {
@@ -368,8 +384,8 @@ TRIPS = [
         "direction_id": DirectionId.OUTBOUND.value,
         "bikes_allowed": BikesAllowed.YES.value,
         "stop_times": [
-            ("8:40", "STOP-1332dd93-e6a0-45e1-b4fd-940d57659703"),
-            ("9:05", "STOP-1c531172-cfcf-4843-8de5-ca23289d30b5"),
+            ("08:40", "STOP-1332dd93-e6a0-45e1-b4fd-940d57659703"),
+            ("09:05", "STOP-1c531172-cfcf-4843-8de5-ca23289d30b5"),
         ],
     },
     {
@@ -389,7 +405,9 @@ TRIPS = [
 
 # Load stops from stops.geojson
 def load_stops():
-    with open(f"{script_dir}/stops.geojson", "r", encoding="utf-8") as f:
+    import geojson
+
+    with open(f"{DATA_DIR}/stops.geojson", "r", encoding="utf-8") as f:
         stops_geojson = geojson.load(f)
 
     stops = []
@@ -409,29 +427,33 @@ def load_stops():
     return stops
 
 
-STOPS = load_stops()
-
 # stops.geojson is now the source of truth - no longer generated here
 
-# Generate route URLs
-stop_lookup = {s["stop_id"]: (s["stop_lon"], s["stop_lat"]) for s in STOPS}
 
-# 2) Generate URLs for each trip
-base = "https://brouter.de/brouter-web/#map=11/44.5866/-68.0370/standard&lonlats="
-suffix = "&profile=car-fast"
+@functools.cache
+def get_stop_lookup():
+    """Map each stop_id to its (lon, lat) pair."""
+    return {s["stop_id"]: (s["stop_lon"], s["stop_lat"]) for s in FILES["stops.txt"]}
+
 
-urls = {
-    trip["trip_id"]: (
-        base
-        + ";".join(
-            ",".join(map(str, stop_lookup[stop_id]))
-            for _, stop_id in trip["stop_times"]
+def brouter_urls():
+    """Build a brouter.de URL routing each trip through its stops."""
+    stop_lookup = get_stop_lookup()
+    base = "https://brouter.de/brouter-web/#map=11/44.5866/-68.0370/standard&lonlats="
+    suffix = "&profile=car-fast"
+
+    return {
+        trip["trip_id"]: (
+            base
+            + ";".join(
+                ",".join(map(str, stop_lookup[stop_id]))
+                for _, stop_id in trip["stop_times"]
+            )
+            + suffix
         )
-        + suffix
-    )
-    for trip in TRIPS
-}
-print(json.dumps(urls, indent=2))
+        for trip in TRIP_PATTERNS
+    }
+
 
 CALENDAR = [
     {
@@ -496,70 +518,659 @@ CALENDAR = [
     },
 ]
 
-CALENDAR_DATES = [
-    [
+
+def calendar_dates(today=None):
+    """Add the first Wednesday of each month, from today to FEED_END.
+
+    today defaults to FEED_START so the feed does not depend on the build date.
+    """
+    from service_calendar import WEEKDAYS, nth_weekday_of_month, to_yyyymmdd
+
+    wednesdays = nth_weekday_of_month(
+        today or FEED_START, FEED_END, WEEKDAYS.index("wednesday")
+    )
+    return [
         {
             "service_id": FW_OF_MONTH_SERVICE_ID,
-            "date": int(f"{year:4}{month:02}{day:02}"),
+            "date": int(day),
             "exception_type": ServiceException.ADDED.value,
         }
-        # Look at the first week and choose the first wednesday
-        for day in range(1, 8)
-        if datetime(year=year, month=month, day=day).weekday()
-        == calendar.WEDNESDAY.value
-    ].pop()
-    # Look at each month for the next 2 years
-    for year, month in [
-        (now.year + (now.month - 1 + i) // 12, (now.month - 1 + i) % 12 + 1)
-        for i in range(12 * 2)
+        for day in to_yyyymmdd(wednesdays)
     ]
-]
 
-FILES = {
-    "agency.txt": [AGENCY],
-    "stops.txt": STOPS,
-    "routes.txt": ROUTES,
-    "trips.txt": [
-        {k: v for k, v in trip.items() if k != "stop_times"} for trip in TRIPS
-    ],
+
+@functools.lru_cache(maxsize=4)
+def service_calendar(today=None):
+    """Bitsets of every service_id from FEED_START to FEED_END."""
+    from service_calendar import ServiceCalendar
+
+    return ServiceCalendar(CALENDAR, calendar_dates(today), FEED_START, FEED_END)
+
+
+@functools.cache
+def expanded_trips():
+    """TRIP_PATTERNS expanded into trips and stop_times arrays."""
+    from trip_patterns import ExpandedTrips
+
+    return ExpandedTrips(TRIP_PATTERNS)
+
+
+def build_errors():
+    """(table, message) for each trip pattern left out of the feed."""
+    return [("trips.txt", message) for message in expanded_trips().errors]
+
+
+@functools.cache
+def _legacy_trips():
+    return expanded_trips().legacy_trips()
+
+
+def build_trips():
+    return expanded_trips().trips
+
+
+def trip_stop_distances(trip):
+    """shape_dist_traveled of each stop of a trip or pattern, or None if it has no shape.
+
+    Stops missing from stops.txt get None, and are left for validate to report.
+    """
+    if "shape_id" not in trip:
+        return None
+    from linear_ref import project_stops
+
+    stop_lookup = get_stop_lookup()
+    stop_ids = [stop_id for _, stop_id in trip["stop_times"]]
+    known = [stop_id in stop_lookup for stop_id in stop_ids]
+    lonlat, _ = simplified_shape(trip["shape_id"])
+    points = [stop_lookup[stop_id] for stop_id in stop_ids if stop_id in stop_lookup]
+    measures = iter(project_stops(lonlat, points).tolist() if points else [])
+    return [next(measures) if k else None for k in known]
+
+
+@functools.cache
+def _pattern_stop_distances():
+    """shape_dist_traveled of every stop of every pattern, "" where there is none."""
+    # Stops are projected onto the shape once per pattern, not once per trip
+    distances = []
+    for pattern in TRIP_PATTERNS:
+        pattern_distances = trip_stop_distances(pattern)
+        distances.extend(
+            [""] * len(pattern["stop_times"])
+            if pattern_distances is None
+            else ["" if d is None else round(d, 1) for d in pattern_distances]
+        )
+    return distances
+
+
+def build_stop_times():
+    from trip_patterns import format_times
+
+    expanded = expanded_trips()
+    distances = _pattern_stop_distances()
+    columns = expanded.stop_times
+    trip_ids = [trip["trip_id"] for trip in expanded.trips]
+    for trip, time, stop, seq in zip(
+        columns["trip"].tolist(),
+        format_times(columns["time"]),
+        columns["pattern_stop"].tolist(),
+        columns["stop_sequence"].tolist(),
+    ):
+        yield {
+            "trip_id": trip_ids[trip],
+            "arrival_time": time,
+            "departure_time": time,
+            "stop_id": expanded.stop_ids[stop],
+            "stop_sequence": seq,
+            "shape_dist_traveled": distances[stop],
+        }
+
+
+def build_frequencies():
+    from trip_patterns import format_times
+
+    for row in expanded_trips().frequencies:
+        start, end = format_times([row["start_time"], row["end_time"]])
+        yield {**row, "start_time": start, "end_time": end}
+
+
+def shape_ids():
+    """shape_id of every pattern, each once, in TRIP_PATTERNS order."""
+    return list(
+        dict.fromkeys(p["shape_id"] for p in TRIP_PATTERNS if "shape_id" in p)
+    )
+
+
+def shape_path(shape_id):
+    return f"{DATA_DIR}/shapes/{shape_id}.geojson"
+
+
+# How shapes.txt is simplified; main() overrides these from the command line
+SHAPE_OPTIONS = {
+    # Douglas–Peucker tolerance in metres, 0 keeps every vertex
+    "tolerance_m": 2.0,
+    # Per shape_id overrides of tolerance_m
+    "shape_tolerance_m": {},
+    # Decimal places kept in shape coordinates
+    "decimals": 6,
+}
+
+
+def simplified_shape(shape_id):
+    """Simplify a shape per SHAPE_OPTIONS, returning (lon/lat array, report)."""
+    tolerance = SHAPE_OPTIONS["shape_tolerance_m"].get(
+        shape_id, SHAPE_OPTIONS["tolerance_m"]
+    )
+    return _simplified_shape(shape_id, tolerance, SHAPE_OPTIONS["decimals"])
+
+
+@functools.cache
+def raw_shapes():
+    """Coordinates of every shape in shape_ids(), read together in parallel."""
+    from shape_reader import read_lines
+
+    ids = shape_ids()
+    return dict(zip(ids, read_lines([shape_path(shape_id) for shape_id in ids])))
+
+
+# Shared by shapes.txt, stop_times.txt and validation, which each stream the
+# shapes again; simplified, they are a fraction of the raw_shapes() kept anyway
+@functools.cache
+def _simplified_shape(shape_id, tolerance, decimals):
+    from simplify import simplify
+
+    coords = raw_shapes().get(shape_id)
+    if coords is None:
+        coords = _coords(shape_path(shape_id))
+    return simplify(coords, tolerance, decimals)
+
+
+def shape_report():
+    """Vertex counts and maximum deviation of each simplified shape."""
+    return {shape_id: simplified_shape(shape_id)[1] for shape_id in shape_ids()}
+
+
+def build_shapes():
+    # Shapes are simplified one at a time, as their rows are consumed
+    for shape_id in shape_ids():
+        from linear_ref import cumulative_distance
+
+        lonlat, _ = simplified_shape(shape_id)
+        distances = cumulative_distance(lonlat).round(1)
+        for seq, ((lon, lat), dist) in enumerate(
+            zip(lonlat.tolist(), distances.tolist()), start=1
+        ):
+            yield {
+                "shape_id": shape_id,
+                "shape_pt_lat": lat,
+                "shape_pt_lon": lon,
+                "shape_pt_sequence": seq,
+                "shape_dist_traveled": dist,
+            }
+
+
+class LazyTables(Mapping):
+    """Map GTFS file names to their rows, building each table on first access.
+
+    Builders return an iterable of row dicts. Indexing keeps the built table
+    as a list; iter_rows() streams a table that has not been built yet
+    without keeping it.
+    """
+
+    def __init__(self, builders):
+        self._builders = builders
+        self._tables = {}
+
+    def __getitem__(self, filename):
+        if filename not in self._tables:
+            self._tables[filename] = list(self._builders[filename]())
+        return self._tables[filename]
+
+    def __contains__(self, filename):
+        # Mapping's own test indexes the table, which would build it
+        return filename in self._builders
+
+    def iter_rows(self, filename):
+        if filename in self._tables:
+            return iter(self._tables[filename])
+        return iter(self._builders[filename]())
+
+    def __iter__(self):
+        return iter(self._builders)
+
+    def __len__(self):
+        return len(self._builders)
+
+    def is_built(self, filename):
+        return filename in self._tables
+
+
+FILES = LazyTables(
+    {
+        "agency.txt": lambda: [AGENCY],
+        "stops.txt": load_stops,
+        "routes.txt": lambda: ROUTES,
+        "trips.txt": build_trips,
+        "stop_times.txt": build_stop_times,
+        "calendar.txt": lambda: service_calendar().to_gtfs()[0],
+        "calendar_dates.txt": lambda: service_calendar().to_gtfs()[1],
+        "feed_info.txt": lambda: [FEED_INFO],
+        "shapes.txt": build_shapes,
+        "frequencies.txt": build_frequencies,
+    }
+)
+
+# Tables left out of the feed when they have no rows
+OPTIONAL_TABLES = {"frequencies.txt"}
+
+
+def feed_tables():
+    """The tables written by default: every table in FILES with rows to write."""
+    return [f for f in FILES if f not in OPTIONAL_TABLES or FILES[f]]
+
+
+# Names that used to be computed at import time, now built on first access
+_LAZY_ATTRS = {
+    "TRIPS": _legacy_trips,
+    "STOPS": lambda: FILES["stops.txt"],
+    "CALENDAR_DATES": lambda: FILES["calendar_dates.txt"],
+    "stop_lookup": get_stop_lookup,
+    "urls": brouter_urls,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        return _LAZY_ATTRS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _code_inputs(*code):
+    """Digests of the source of the modules and functions a table is built with."""
+    return [source_digest(c) for c in code]
+
+
+def _stops_inputs():
+    return [file_digest(f"{DATA_DIR}/stops.geojson")] + _code_inputs(load_stops)
+
+
+def _shapes_inputs():
+    import linear_ref
+    import shape_reader
+    import simplify
+
+    ids = shape_ids()
+    code = _code_inputs(
+        shape_reader,
+        simplify,
+        linear_ref,
+        raw_shapes,
+        _coords,
+        simplified_shape,
+        _simplified_shape,
+    )
+    return (
+        [value_digest([ids, SHAPE_OPTIONS])]
+        + [file_digest(shape_path(shape_id)) for shape_id in ids]
+        + code
+    )
+
+
+def _trips_inputs():
+    import trip_patterns
+
+    return [value_digest(TRIP_PATTERNS)] + _code_inputs(trip_patterns, expanded_trips)
+
+
+def _table_inputs(filename):
+    if filename == "stops.txt":
+        return _stops_inputs()
+    if filename == "shapes.txt":
+        return _shapes_inputs() + _code_inputs(build_shapes)
+    if filename == "stop_times.txt":
+        # shape_dist_traveled projects the stops onto the shapes
+        code = _code_inputs(
+            build_stop_times,
+            _pattern_stop_distances,
+            trip_stop_distances,
+            get_stop_lookup,
+        )
+        return _trips_inputs() + _stops_inputs() + _shapes_inputs() + code
+    if filename in ("calendar.txt", "calendar_dates.txt"):
+        import service_calendar as calendar_module
+
+        return [
+            value_digest([CALENDAR, calendar_dates(), FEED_START, FEED_END])
+        ] + _code_inputs(calendar_module, service_calendar)
+    if filename == "trips.txt":
+        return _trips_inputs() + _code_inputs(build_trips)
+    # The remaining tables are rendered straight from their rows
+    return [value_digest(FILES[filename])]
+
+
+def table_inputs(filename):
+    """Digests of everything the given table is built from, for the build cache.
+
+    That is its data and the code that builds and writes it, so an edit to a
+    builder module rebuilds the tables it goes into.
+    """
+    import gtfs_writer
+
+    written = _code_inputs(gtfs_writer, write_table, table_columns)
+    return written + [value_digest(STREAMED_COLUMNS)] + _table_inputs(filename)
+
+
+# Tables too large to scan for their columns before they are streamed
+STREAMED_COLUMNS = {
     "stop_times.txt": [
-        item
-        for sublist in [
-            [
-                {
-                    "trip_id": trip["trip_id"],
-                    "arrival_time": f"{time}:00",
-                    "departure_time": f"{time}:00",
-                    "stop_id": stop_id,
-                    "stop_sequence": i,
-                }
-                for i, (time, stop_id) in enumerate(trip["stop_times"])
-            ]
-            for trip in TRIPS
-        ]
-        for item in sublist
+        "trip_id",
+        "arrival_time",
+        "departure_time",
+        "stop_id",
+        "stop_sequence",
+        "shape_dist_traveled",
     ],
-    "calendar.txt": CALENDAR,
-    "calendar_dates.txt": CALENDAR_DATES,
-    "feed_info.txt": [FEED_INFO],
     "shapes.txt": [
-        {
-            "shape_id": trip["shape_id"],
-            "shape_pt_lat": lat,
-            "shape_pt_lon": lon,
-            "shape_pt_sequence": seq,
-        }
-        for trip in TRIPS
-        if "shape_id" in trip
-        for seq, (lon, lat, *_) in enumerate(
-            _coords(f"{script_dir}/shapes/{trip['shape_id']}.geojson"), start=1
-        )
+        "shape_id",
+        "shape_pt_lat",
+        "shape_pt_lon",
+        "shape_pt_sequence",
+        "shape_dist_traveled",
     ],
 }
 
 
+def table_columns(filename):
+    """Columns of the given table in GTFS order, leaving out unused optional ones."""
+    if filename in STREAMED_COLUMNS:
+        return STREAMED_COLUMNS[filename]
+    return present_columns(filename, FILES[filename])
+
+
+def write_table(f, filename):
+    write_csv(f, table_columns(filename), FILES.iter_rows(filename))
+
+
+def write_feed(filenames, output, cache=None, compresslevel=None):
+    """Write the given tables as a zip if output ends in .zip, else as a directory.
+
+    With a cache, tables are taken from it when their inputs are unchanged and
+    only built otherwise. Without one, rows are streamed straight into the
+    output. Returns whether output changed.
+    """
+
+    def render(filename):
+        def to_csv(path):
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                write_table(f, filename)
+
+        return to_csv
+
+    def cached(filename, record):
+        path, hit = cache.get_or_build(
+            filename, table_inputs(filename), render(filename)
+        )
+        if PROFILER.enabled:
+            record["cache"] = "hit" if hit else "miss"
+            with open(path, "rb") as f:
+                record["rows"] = sum(chunk.count(b"\n") for chunk in f) - 1
+        return path
+
+    def rows(filename, record):
+        rows = FILES.iter_rows(filename)
+        if not PROFILER.enabled:
+            return rows
+        record["rows"] = 0
+
+        def counted():
+            for row in rows:
+                record["rows"] += 1
+                yield row
+
+        return counted()
+
+    output = Path(output)
+    if output.suffix == ".zip":
+        with PROFILER.phase("write zip"):
+            with ZipFeedWriter(output, compresslevel) as writer:
+                for filename in filenames:
+                    with PROFILER.phase(f"write {filename}", table=filename) as record:
+                        if cache is None:
+                            writer.write_rows(
+                                filename,
+                                table_columns(filename),
+                                rows(filename, record),
+                            )
+                        else:
+                            writer.write_file(filename, cached(filename, record))
+        return writer.changed
+
+    output.mkdir(parents=True, exist_ok=True)
+    changed = False
+    for filename in filenames:
+        target = output / filename
+        with PROFILER.phase(f"write {filename}", table=filename) as record:
+            if cache is None:
+                with open(target, "w", encoding="utf-8", newline="") as f:
+                    write_csv(f, table_columns(filename), rows(filename, record))
+                changed = True
+                continue
+            path = cached(filename, record)
+            if not target.exists() or file_digest(target) != file_digest(path):
+                shutil.copyfile(path, target)
+                changed = True
+    return changed
+
+
+def write_sidecar(zip_path, output, cache=None):
+    """Write the binary sidecar of the zip at zip_path; returns whether output changed.
+
+    With a cache, the sidecar is reused while the zip and the code that
+    converts it are unchanged, and copied over output when they differ.
+    """
+    import binary_feed
+
+    def render(path):
+        binary_feed.write(binary_feed.build_arrays(zip_path), path)
+
+    with PROFILER.phase("sidecar") as record:
+        if cache is None:
+            return binary_feed.write(binary_feed.build_arrays(zip_path), output)
+        inputs = [file_digest(zip_path)] + _code_inputs(*_local_imports(binary_feed))
+        path, hit = cache.get_or_build("sidecar", inputs, render, suffix=".bin")
+        record["cache"] = "hit" if hit else "miss"
+        if output.exists() and file_digest(output) == file_digest(path):
+            return False
+        shutil.copyfile(path, output)
+        return True
+
+
+def _local_imports(module):
+    """module and the modules of scripts/ it imports, or imports names from."""
+    modules = {module.__name__: module}
+    for value in vars(module).values():
+        source = value if inspect.ismodule(value) else inspect.getmodule(value)
+        path = getattr(source, "__file__", None)
+        if path and os.path.dirname(os.path.realpath(path)) == script_dir:
+            modules[source.__name__] = source
+    return [modules[name] for name in sorted(modules)]
+
+
+def validation_report(cache=None):
+    """validate's report on FILES, reused from cache while no table's inputs change."""
+    import validate
+
+    def check(path):
+        validate.write_report(validate.validate(FILES, build_errors()), path)
+
+    with PROFILER.phase("validate") as record:
+        if cache is None:
+            return validate.validate(FILES, build_errors())
+        code = _code_inputs(*_local_imports(validate))
+        inputs = code + [table_inputs(f) for f in FILES]
+        path, hit = cache.get_or_build("validation", inputs, check, suffix=".json")
+        record["cache"] = "hit" if hit else "miss"
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=list(FILES),
+        metavar="TABLE",
+        help="only build these tables, e.g. --only stop_times.txt shapes.txt",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="zip file or directory to write (default: west_gtfs.zip, "
+        "or the west_gtfs/ directory with --only)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=CACHE_DIR,
+        help="directory of cached tables (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="rebuild every table without reading or filling the cache",
+    )
+    parser.add_argument(
+        "--compresslevel",
+        type=int,
+        choices=range(10),
+        metavar="0-9",
+        help="zlib compression level for the zip (default: zlib's default)",
+    )
+    parser.add_argument(
+        "--no-sidecar",
+        action="store_true",
+        help="do not write the binary sidecar (west_gtfs.bin) next to a zip",
+    )
+    parser.add_argument(
+        "--no-validate",
+        action="store_true",
+        help="write the feed without checking it first",
+    )
+    parser.add_argument(
+        "--validation-report",
+        type=Path,
+        metavar="FILE",
+        help="write the validation report as JSON",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        metavar="FILE",
+        help="write the time, memory and rows of each phase as JSON",
+    )
+    parser.add_argument(
+        "--profile-cprofile",
+        type=Path,
+        metavar="FILE",
+        help="with --profile, write cProfile stats of the slowest phase",
+    )
+    parser.add_argument(
+        "--shape-tolerance",
+        type=float,
+        default=SHAPE_OPTIONS["tolerance_m"],
+        metavar="METRES",
+        help="simplify shapes to within this distance, 0 to keep every vertex "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--shape-decimals",
+        type=int,
+        default=SHAPE_OPTIONS["decimals"],
+        help="decimal places kept in shape coordinates (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--shape-report",
+        type=Path,
+        metavar="FILE",
+        help="write vertex counts and deviation of each shape as JSON",
+    )
+    parser.add_argument(
+        "--brouter-urls",
+        action="store_true",
+        help="print a brouter.de URL routing each trip through its stops and exit; "
+        "shape_snap.py mends most shapes offline",
+    )
+    args = parser.parse_args(argv)
+    if args.brouter_urls:
+        print(json.dumps(brouter_urls(), indent=2))
+        return 0
+    SHAPE_OPTIONS["tolerance_m"] = args.shape_tolerance
+    SHAPE_OPTIONS["decimals"] = args.shape_decimals
+
+    filenames = args.only or feed_tables()
+    output = args.output or (
+        feed_path if args.only else feed_path.with_suffix(".zip")
+    )
+
+    if args.profile:
+        PROFILER.start(cprofile=args.profile_cprofile is not None)
+    try:
+        return build(args, filenames, output)
+    finally:
+        if args.profile:
+            report = PROFILER.report()
+            if args.profile_cprofile:
+                report["cprofile"] = {
+                    "phase": PROFILER.dump_slowest(args.profile_cprofile),
+                    "path": str(args.profile_cprofile),
+                }
+            PROFILER.stop()
+            args.profile.write_text(json.dumps(report, indent=2) + "\n")
+
+
+def build(args, filenames, output):
+    """The body of main(), split out so it can be profiled as a whole."""
+    if "stops.txt" in filenames:
+        from stop_index import check_stops
+
+        with PROFILER.phase("check stops"):
+            for warning in check_stops(FILES["stops.txt"]):
+                print(f"warning: {warning}", file=sys.stderr)
+
+    cache = None if args.no_cache else BuildCache(args.cache_dir)
+    # Checks need every table, so a partial build with --only is not checked
+    if not (args.no_validate or args.only):
+        import validate
+
+        report = validation_report(cache)
+        validate.print_issues(report)
+        if args.validation_report:
+            validate.write_report(report, args.validation_report)
+        if not report["valid"]:
+            print(f"{output}: not written, the feed has errors", file=sys.stderr)
+            return 1
+
+    changed = write_feed(filenames, output, cache, args.compresslevel)
+    print(f"{output}: {'updated' if changed else 'unchanged'}", file=sys.stderr)
+
+    if output.suffix == ".zip" and not args.no_sidecar:
+        sidecar = output.with_suffix(".bin")
+        written = write_sidecar(output, sidecar, cache)
+        print(f"{sidecar}: {'updated' if written else 'unchanged'}", file=sys.stderr)
+
+    # Only a full build knows every entry still in use
+    if cache is not None and not args.only:
+        removed = cache.prune()
+        if removed:
+            print(f"{cache.root}: {removed} unused entries removed", file=sys.stderr)
+
+    if args.shape_report:
+        args.shape_report.write_text(json.dumps(shape_report(), indent=2) + "\n")
+    return 0
+
+
 if __name__ == "__main__":
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        for filename, data in FILES.items():
-            pd.DataFrame(data).to_csv(Path(tmpdirname) / filename, index=False)
-        shutil.make_archive(str(feed_path), "zip", tmpdirname)
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Stream GTFS rows as CSV, straight into a reproducible zip.
+
+Rows are dicts and are written as they are produced, so a table never has
+to be held in memory to be written.
+"""
+
+import csv
+import io
+import os
+import shutil
+import zipfile
+from pathlib import Path
+
+from build_cache import file_digest
+
+# Column order from the GTFS reference, for the tables this feed writes
+GTFS_COLUMNS = {
+    "agency.txt": [
+        "agency_id",
+        "agency_name",
+        "agency_url",
+        "agency_timezone",
+        "agency_lang",
+        "agency_phone",
+        "agency_fare_url",
+        "agency_email",
+    ],
+    "stops.txt": [
+        "stop_id",
+        "stop_code",
+        "stop_name",
+        "tts_stop_name",
+        "stop_desc",
+        "stop_lat",
+        "stop_lon",
+        "zone_id",
+        "stop_url",
+        "location_type",
+        "parent_station",
+        "stop_timezone",
+        "wheelchair_boarding",
+        "level_id",
+        "platform_code",
+    ],
+    "routes.txt": [
+        "route_id",
+        "agency_id",
+        "route_short_name",
+        "route_long_name",
+        "route_desc",
+        "route_type",
+        "route_url",
+        "route_color",
+        "route_text_color",
+        "route_sort_order",
+        "continuous_pickup",
+        "continuous_drop_off",
+        "network_id",
+    ],
+    "trips.txt": [
+        "route_id",
+        "service_id",
+        "trip_id",
+        "trip_headsign",
+        "trip_short_name",
+        "direction_id",
+        "block_id",
+        "shape_id",
+        "wheelchair_accessible",
+        "bikes_allowed",
+    ],
+    "stop_times.txt": [
+        "trip_id",
+        "arrival_time",
+        "departure_time",
+        "stop_id",
+        "stop_sequence",
+        "stop_headsign",
+        "pickup_type",
+        "drop_off_type",
+        "continuous_pickup",
+        "continuous_drop_off",
+        "shape_dist_traveled",
+        "timepoint",
+    ],
+    "calendar.txt": [
+        "service_id",
+        "monday",
+        "tuesday",
+        "wednesday",
+        "thursday",
+        "friday",
+        "saturday",
+        "sunday",
+        "start_date",
+        "end_date",
+    ],
+    "calendar_dates.txt": ["service_id", "date", "exception_type"],
+    "feed_info.txt": [
+        "feed_publisher_name",
+        "feed_publisher_url",
+        "feed_lang",
+        "default_lang",
+        "feed_start_date",
+        "feed_end_date",
+        "feed_version",
+        "feed_contact_email",
+        "feed_contact_url",
+    ],
+    "shapes.txt": [
+        "shape_id",
+        "shape_pt_lat",
+        "shape_pt_lon",
+        "shape_pt_sequence",
+        "shape_dist_traveled",
+    ],
+    "frequencies.txt": [
+        "trip_id",
+        "start_time",
+        "end_time",
+        "headway_secs",
+        "exact_times",
+    ],
+}
+
+# Fixed timestamp for zip entries so identical tables give an identical zip
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def present_columns(filename, rows):
+    """Columns used by any of rows, in GTFS order then first-seen order.
+
+    Optional columns such as route_short_name are kept as long as one row
+    sets them; rows without them get an empty value.
+    """
+    seen = {}
+    for row in rows:
+        seen.update(dict.fromkeys(row))
+    spec = GTFS_COLUMNS.get(filename, [])
+    return [c for c in spec if c in seen] + [c for c in seen if c not in spec]
+
+
+def write_csv(f, columns, rows):
+    """Write rows to the text file f, one line at a time."""
+    writer = csv.DictWriter(f, columns, restval="", lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+class ZipFeedWriter:
+    """Write tables into a byte-reproducible zip without a temporary directory.
+
+    Entries get a fixed timestamp and keep the order they are written in.
+    The zip is built next to output and only replaces it on close if its
+    bytes differ; changed is set accordingly.
+    """
+
+    def __init__(self, output, compresslevel=None):
+        self.output = Path(output)
+        self.compresslevel = compresslevel
+        self.changed = False
+        self._tmp_path = self.output.with_name(f"{self.output.name}.tmp")
+        self._zf = None
+
+    def __enter__(self):
+        self._zf = zipfile.ZipFile(self._tmp_path, "w")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._zf.close()
+        if exc_type is not None:
+            self._tmp_path.unlink()
+        elif self.output.exists() and file_digest(self.output) == file_digest(
+            self._tmp_path
+        ):
+            self._tmp_path.unlink()
+        else:
+            os.replace(self._tmp_path, self.output)
+            self.changed = True
+
+    def _open(self, arcname):
+        info = zipfile.ZipInfo(arcname, date_time=ZIP_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        # Public as ZipInfo.compress_level from Python 3.13
+        info._compresslevel = self.compresslevel
+        info.external_attr = 0o644 << 16
+        return self._zf.open(info, "w")
+
+    def write_rows(self, arcname, columns, rows):
+        with self._open(arcname) as dst:
+            with io.TextIOWrapper(dst, encoding="utf-8", newline="") as f:
+                write_csv(f, columns, rows)
+
+    def write_file(self, arcname, path):
+        with open(path, "rb") as src, self._open(arcname) as dst:
+            shutil.copyfileobj(src, dst)
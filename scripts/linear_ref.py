@@ -0,0 +1,113 @@
+"""Linear referencing of stops along shapes, for shape_dist_traveled.
+
+Distances are in metres along the shape, measured with the haversine
+formula between consecutive vertices.
+"""
+
+import numpy as np
+
+from segment_index import SegmentIndex
+from simplify import EARTH_RADIUS_M, project, segment_offsets
+
+# Candidate positions considered per stop when keeping the order monotonic
+CANDIDATES = 8
+
+# Passes of the shape further from a stop than its nearest one by more than
+# this are not candidates, on shapes long enough to use a SegmentIndex
+CANDIDATE_M = 1000
+# Up to this many segments, measuring every stop against all of them at once
+# is faster than querying the index
+SCAN_ALL = 8192
+
+
+def haversine(lonlat_a, lonlat_b):
+    """Great-circle distance in metres between paired (n, 2) lon/lat arrays."""
+    lon1, lat1 = np.radians(lonlat_a).T
+    lon2, lat2 = np.radians(lonlat_b).T
+    h = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(h))
+
+
+def cumulative_distance(lonlat):
+    """Distance in metres from the first vertex to each vertex of a shape."""
+    lonlat = np.asarray(lonlat, dtype=float)
+    return np.concatenate(([0.0], np.cumsum(haversine(lonlat[:-1], lonlat[1:]))))
+
+
+def _candidates(xy, measure, seg_len, point, segments=None):
+    """Closest positions along the shape to point, as (distance, measure) arrays.
+
+    Only the local minima of the distance to each segment are candidates, so
+    a stop passed twice on a loop gets one candidate per pass. segments, if
+    given, are the sorted indices of the only segments considered.
+    """
+    if segments is None:
+        segments = np.arange(len(seg_len))
+    dist, t = segment_offsets(point, xy[segments], xy[segments + 1])
+
+    # Segments that are not neighbours along the shape do not compete
+    adjacent = np.diff(segments) == 1
+    before = np.concatenate(([np.inf], np.where(adjacent, dist[:-1], np.inf)))
+    after = np.concatenate((np.where(adjacent, dist[1:], np.inf), [np.inf]))
+    minima = np.flatnonzero((dist <= before) & (dist <= after))
+    minima = minima[np.argsort(dist[minima], kind="stable")[:CANDIDATES]]
+    at = segments[minima]
+    return dist[minima], measure[at] + t[minima] * seg_len[at]
+
+
+def snap_stops(lonlat, stops_lonlat):
+    """Distance along a shape of each stop, and its offset from the shape, in metres.
+
+    Stops are taken in the order the trip visits them, and their distances
+    never decrease: among the candidate positions of every stop, the
+    sequence with the smallest total offset that is still monotonic is
+    chosen. On long shapes candidates come from a SegmentIndex, so each stop
+    only measures the segments around it.
+    """
+    lonlat = np.asarray(lonlat, dtype=float)[:, :2]
+    stops_lonlat = np.asarray(stops_lonlat, dtype=float)
+    lat0 = lonlat[:, 1].mean()
+    xy = project(lonlat, lat0)
+    stops_xy = project(stops_lonlat, lat0)
+    measure = cumulative_distance(lonlat)
+    seg_len = np.diff(measure)
+    if not len(seg_len):
+        return np.zeros(len(stops_lonlat)), np.hypot(*(stops_xy - xy[:1]).T)
+    index = SegmentIndex(xy) if len(seg_len) > SCAN_ALL else None
+
+    cost = np.zeros(1)
+    position = np.zeros(1)
+    back = []
+    for point in stops_xy:
+        segments = None if index is None else index.candidates(point, CANDIDATE_M)
+        dist, at = _candidates(xy, measure, seg_len, point, segments)
+        # Best predecessor at or before each candidate, inf if there is none
+        feasible = position[None, :] <= at[:, None] + 1e-6
+        total = np.where(feasible, cost[None, :], np.inf)
+        best = total.argmin(axis=1)
+        new_cost = total[np.arange(len(at)), best] + dist
+        if np.isinf(new_cost).all():
+            # Nothing ahead of the previous stop: hold at its position
+            best = np.arange(len(position))
+            dist = np.full(len(position), dist.min())
+            new_cost = cost + dist
+            at = position
+        cost, position = new_cost, at
+        back.append((best, at, dist))
+
+    result = np.empty(len(stops_xy))
+    offsets = np.empty(len(stops_xy))
+    i = int(cost.argmin())
+    for j in range(len(back) - 1, -1, -1):
+        best, at, dist = back[j]
+        result[j], offsets[j] = at[i], dist[i]
+        i = best[i]
+    return result, offsets
+
+
+def project_stops(lonlat, stops_lonlat):
+    """Distance along a shape of each stop, in the order the trip visits them."""
+    return snap_stops(lonlat, stops_lonlat)[0]
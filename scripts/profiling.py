@@ -0,0 +1,98 @@
+"""Per-phase wall time, CPU time, memory and row counts of a build.
+
+A Profiler does nothing until it is started, so phases can be marked
+unconditionally. Once started, each phase records wall and CPU seconds and
+the peak memory traced by tracemalloc while it ran. Tracing memory slows
+Python down, so timings under --profile are higher than in a plain run.
+
+With cprofile set, every phase is also run under cProfile, and the stats of
+the slowest phase can be dumped for pstats or snakeviz.
+"""
+
+import contextlib
+import cProfile
+import time
+import tracemalloc
+
+
+class Profiler:
+    """Phases of one run, recorded between start() and stop(), in finishing order."""
+
+    def __init__(self):
+        self.enabled = False
+        self.phases = []
+        self._cprofile = False
+        self._profiles = {}
+        self._stack = []
+
+    def start(self, cprofile=False):
+        self.enabled = True
+        self._cprofile = cprofile
+        self._started = (time.perf_counter(), time.process_time())
+        tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name, **fields):
+        """Record the enclosed block as a phase; yields its record to add fields to.
+
+        Phases may nest; a parent's peak memory includes its children's.
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        record = {"phase": name, **fields}
+        parent = self._stack[-1] if self._stack else None
+        if parent is not None:
+            parent["_peak"] = max(parent["_peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        record["_peak"] = 0
+        self._stack.append(record)
+
+        # cProfile allows one active profile, so nested phases share the outer one
+        profile = None
+        if self._cprofile and not any("_profile" in r for r in self._stack[:-1]):
+            profile = record["_profile"] = cProfile.Profile()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+            record["wall_s"] = round(time.perf_counter() - wall, 6)
+            record["cpu_s"] = round(time.process_time() - cpu, 6)
+            current, peak = tracemalloc.get_traced_memory()
+            record["peak_bytes"] = max(record.pop("_peak"), peak)
+            record["net_bytes"] = current - start_bytes
+            self._stack.pop()
+            if record.pop("_profile", None):
+                self._profiles[len(self.phases)] = profile
+            self.phases.append(record)
+            tracemalloc.reset_peak()
+            if parent is not None:
+                parent["_peak"] = max(parent["_peak"], record["peak_bytes"])
+
+    def report(self):
+        """The phases in the order they finished, with totals for the run."""
+        wall, cpu = self._started
+        return {
+            "wall_s": round(time.perf_counter() - wall, 6),
+            "cpu_s": round(time.process_time() - cpu, 6),
+            "peak_bytes": max((p["peak_bytes"] for p in self.phases), default=0),
+            "phases": self.phases,
+        }
+
+    def dump_slowest(self, path):
+        """Write the cProfile stats of the slowest profiled phase; returns its name."""
+        if not self._profiles:
+            return None
+        slowest = max(self._profiles, key=lambda i: self.phases[i]["wall_s"])
+        self._profiles[slowest].dump_stats(path)
+        return self.phases[slowest]["phase"]
+
+    def stop(self):
+        tracemalloc.stop()
+        self.enabled = False
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+"""Round-based (RAPTOR) journey planner over the feed's trips.
+
+Trips that visit the same stops in the same order are grouped into
+patterns, stored as int32 arrays of stop indices and (trips, stops) time
+matrices. Round k finds the earliest arrival at every stop using at most
+k trips, so the rounds together give the Pareto set of arrival time
+against number of transfers.
+
+    python raptor.py STOP-b11bb36f-65f5-4bfe-abb8-bdf1d76ac3b9 \\
+        STOP-3012643a-132d-4c0d-974e-cdc8714f9368 --when 2025-09-01T08:00
+"""
+
+import json
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+from linear_ref import haversine
+from timetable import seconds_to_time
+from trip_patterns import parse_time
+
+UNREACHED = np.iinfo(np.int32).max
+
+# Walking transfers between stops with the same name
+MAX_WALK_M = 1000
+WALK_SPEED_M_S = 1.2
+
+
+class Raptor:
+    """Compact pattern arrays of the trips in the TRIPS format, ready to query."""
+
+    def __init__(self, trips, stops, service_calendar):
+        self.stop_ids = [stop["stop_id"] for stop in stops]
+        self.stop_names = [stop["stop_name"] for stop in stops]
+        self.stop_index = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.trips = trips
+
+        grouped = defaultdict(list)
+        for i, trip in enumerate(trips):
+            grouped[tuple(self.stop_index[s] for _, s in trip["stop_times"])].append(i)
+
+        # Pattern p: stops[p], trips[p] sorted by departure, times[p] (trips, stops)
+        self.pattern_stops = []
+        self.pattern_trips = []
+        self.pattern_times = []
+        for stop_seq, trip_indices in grouped.items():
+            times = np.array(
+                [
+                    [parse_time(t) for t, _ in trips[i]["stop_times"]]
+                    for i in trip_indices
+                ],
+                dtype=np.int32,
+            )
+            order = np.argsort(times[:, 0], kind="stable")
+            self.pattern_stops.append(np.array(stop_seq, dtype=np.int32))
+            self.pattern_trips.append(np.array(trip_indices, dtype=np.int32)[order])
+            self.pattern_times.append(times[order])
+
+        # Patterns through each stop, with the stop's position in the pattern
+        self.stop_patterns = [[] for _ in self.stop_ids]
+        for p, stop_seq in enumerate(self.pattern_stops):
+            for position, stop in enumerate(stop_seq):
+                self.stop_patterns[stop].append((p, position))
+
+        self.transfers = self._walking_transfers(stops)
+
+        service_rows = [service_calendar.service_ids.index(t["service_id"]) for t in trips]
+        self._runs = service_calendar.matrix()[service_rows]
+        self._first_ordinal = service_calendar.start.astype(object).toordinal()
+
+    def _walking_transfers(self, stops):
+        """(to_stop, seconds) walks from each stop to nearby stops of the same name."""
+        lonlat = np.array([[s["stop_lon"], s["stop_lat"]] for s in stops])
+        names = np.array(self.stop_names)
+        a, b = np.nonzero(names[:, None] == names[None, :])
+        a, b = a[a != b], b[a != b]
+        metres = haversine(lonlat[a], lonlat[b])
+        transfers = [[] for _ in stops]
+        for i, j, m in zip(a, b, metres):
+            if m <= MAX_WALK_M:
+                transfers[i].append((int(j), int(np.ceil(m / WALK_SPEED_M_S))))
+        return transfers
+
+    def _running(self, day):
+        """Boolean array of the trips running on the service day, a date."""
+        offset = day.toordinal() - self._first_ordinal
+        if not 0 <= offset < self._runs.shape[1]:
+            return np.zeros(len(self.trips), dtype=bool)
+        return self._runs[:, offset]
+
+    def query(self, origin, when, max_trips=5):
+        """Earliest arrival at every stop from origin, leaving at the datetime when.
+
+        Returns a Journeys holding one label per round and stop.
+        """
+        running = self._running(when.date())
+        depart = when.hour * 3600 + when.minute * 60 + when.second
+        n_stops = len(self.stop_ids)
+
+        best = np.full(n_stops, UNREACHED, dtype=np.int64)
+        rounds = [np.full(n_stops, UNREACHED, dtype=np.int64)]
+        # How each label was reached: ("trip", trip, board_stop) or ("walk", from_stop)
+        parents = [{}]
+
+        source = self.stop_index[origin]
+        rounds[0][source] = best[source] = depart
+        marked = {source}
+        self._walk(rounds[0], best, parents[0], marked)
+
+        for _ in range(max_trips):
+            previous = rounds[-1]
+            labels = previous.copy()
+            parent = {}
+
+            # Earliest marked position in each pattern
+            queue = {}
+            for stop in marked:
+                for p, position in self.stop_patterns[stop]:
+                    if position < queue.get(p, len(self.pattern_stops[p])):
+                        queue[p] = position
+
+            marked = set()
+            for p, start in queue.items():
+                stops = self.pattern_stops[p]
+                times = self.pattern_times[p]
+                trip_ok = running[self.pattern_trips[p]]
+                trip, board = -1, -1
+                for position in range(start, len(stops)):
+                    stop = stops[position]
+                    if trip >= 0:
+                        arrival = times[trip, position]
+                        if arrival < min(best[stop], labels[stop]):
+                            labels[stop] = best[stop] = arrival
+                            parent[stop] = ("trip", self.pattern_trips[p][trip], board)
+                            marked.add(stop)
+                    # Catch an earlier trip if we can be here before it leaves
+                    if previous[stop] != UNREACHED and (
+                        trip < 0 or previous[stop] <= times[trip, position]
+                    ):
+                        candidates = np.flatnonzero(
+                            trip_ok & (times[:, position] >= previous[stop])
+                        )
+                        if len(candidates) and (trip < 0 or candidates[0] < trip):
+                            trip, board = candidates[0], stop
+
+            self._walk(labels, best, parent, marked)
+            rounds.append(labels)
+            parents.append(parent)
+            if not marked:
+                break
+
+        return Journeys(self, source, rounds, parents)
+
+    def _walk(self, labels, best, parent, marked):
+        for stop in list(marked):
+            for to_stop, seconds in self.transfers[stop]:
+                arrival = labels[stop] + seconds
+                if arrival < min(best[to_stop], labels[to_stop]):
+                    labels[to_stop] = best[to_stop] = arrival
+                    parent[to_stop] = ("walk", stop)
+                    marked.add(to_stop)
+
+
+class Journeys:
+    """Result of a one-to-all query: labels per round, plus how they were reached."""
+
+    def __init__(self, raptor, source, rounds, parents):
+        self.raptor = raptor
+        self.source = source
+        self.rounds = rounds
+        self.parents = parents
+
+    def earliest_arrival(self, stop_id):
+        """Earliest arrival at stop_id in seconds since midnight, or None."""
+        arrival = min(labels[self.raptor.stop_index[stop_id]] for labels in self.rounds)
+        return None if arrival == UNREACHED else int(arrival)
+
+    def pareto(self, stop_id):
+        """(trips taken, arrival seconds) options where fewer trips arrive later."""
+        stop = self.raptor.stop_index[stop_id]
+        options, best = [], UNREACHED
+        for k, labels in enumerate(self.rounds):
+            if labels[stop] < best:
+                best = labels[stop]
+                options.append((k, int(best)))
+        return options
+
+    def legs(self, stop_id, trips_taken=None):
+        """The legs of the journey to stop_id using at most trips_taken trips."""
+        raptor = self.raptor
+        stop = raptor.stop_index[stop_id]
+        k = len(self.rounds) - 1 if trips_taken is None else trips_taken
+        if self.rounds[k][stop] == UNREACHED:
+            return None
+
+        legs = []
+        while stop != self.source:
+            # The round that first set this label
+            while k > 0 and self.rounds[k - 1][stop] == self.rounds[k][stop]:
+                k -= 1
+            how = self.parents[k][stop]
+            arrival = seconds_to_time(self.rounds[k][stop])
+            if how[0] == "walk":
+                legs.append(
+                    {
+                        "walk_from": raptor.stop_ids[how[1]],
+                        "to": raptor.stop_ids[stop],
+                        "arrival": arrival,
+                    }
+                )
+                stop = how[1]
+            else:
+                _, trip, board = how
+                legs.append(
+                    {
+                        "trip_id": raptor.trips[trip]["trip_id"],
+                        "route_id": raptor.trips[trip]["route_id"],
+                        "board": raptor.stop_ids[board],
+                        "alight": raptor.stop_ids[stop],
+                        "arrival": arrival,
+                    }
+                )
+                stop = board
+                k -= 1
+        return legs[::-1]
+
+
+def load():
+    """Planner over the feed defined in gen_gtfs."""
+    import gen_gtfs
+
+    return Raptor(gen_gtfs.TRIPS, gen_gtfs.STOPS, gen_gtfs.service_calendar())
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plan journeys between two stops.")
+    parser.add_argument("origin")
+    parser.add_argument("destination")
+    parser.add_argument(
+        "--when",
+        type=datetime.fromisoformat,
+        default=datetime.now(),
+        help="local departure date and time (default: now)",
+    )
+    parser.add_argument("--max-trips", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    journeys = load().query(args.origin, args.when, args.max_trips)
+    options = [
+        {
+            "trips": k,
+            "arrival": seconds_to_time(arrival),
+            "legs": journeys.legs(args.destination, k),
+        }
+        for k, arrival in journeys.pareto(args.destination)
+    ]
+    print(json.dumps(options, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+
+"""GTFS-Realtime TripUpdates and Alerts, and the site banner, from cancellations.json.
+
+Each entry of cancellations.json cancels one trip, or every trip of one
+route, on one date:
+
+    [
+      {"date": "2025-09-02", "trip_id": "WCCWB", "message": "Driver illness"},
+      {"date": "2025-09-08", "route_id": "ELLS"}
+    ]
+
+Entries are checked against the trips and calendar in gen_gtfs. Past
+entries are dropped. Each feed is written twice under realtime/:
+{feed}.pb holds every entity (FULL_DATASET), and {feed}-differential.pb
+holds only the entities added, changed or deleted since the previous run
+(DIFFERENTIAL). state.json keeps a digest of each entity for that
+comparison. When no entity changed, nothing is rewritten. The same entries
+render cancellation_message.html, which index.html shows as its banner.
+
+    python realtime.py
+    python realtime.py --today 2025-09-01 --serve 8000    # then poll localhost
+    python realtime.py --dump ../realtime/alerts.pb
+"""
+
+import hashlib
+import html
+import json
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import gen_gtfs
+from timetable_pages import format_date, format_time
+from trip_patterns import parse_time
+
+site_dir = Path(gen_gtfs.script_dir).parent
+realtime_dir = site_dir / "realtime"
+CANCELLATIONS = site_dir / "cancellations.json"
+BANNER = site_dir / "cancellation_message.html"
+
+# Shown when nothing is cancelled
+DEFAULT_BANNER = "Check back Daily for Cancellations"
+
+GTFS_RT_VERSION = "2.0"
+FEEDS = ("trip_updates", "alerts")
+
+
+def parse_date(value):
+    """A "YYYY-MM-DD" string or YYYYMMDD int or string as a YYYYMMDD int."""
+    text = str(value).replace("-", "")
+    if len(text) != 8 or not text.isdigit():
+        raise ValueError(f"malformed date {value!r}")
+    try:
+        date(int(text[:4]), int(text[4:6]), int(text[6:]))
+    except ValueError:
+        raise ValueError(f"no such date {value!r}") from None
+    return int(text)
+
+
+def load_cancellations(path=CANCELLATIONS):
+    if not Path(path).exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def resolve(entries, today):
+    """Entries from today on, each with the trips it cancels; returns (entries, errors).
+
+    today is a YYYYMMDD int. Every returned entry has "date" as a YYYYMMDD
+    int and "trips" as the runs in the TRIPS format that run on that date.
+    """
+    routes = {route["route_id"]: route for route in gen_gtfs.ROUTES}
+    trips = {}
+    for trip in gen_gtfs.TRIPS:
+        trips.setdefault(trip["trip_id"], []).append(trip)
+    services = gen_gtfs.service_calendar()
+
+    resolved, errors = [], []
+    for i, entry in enumerate(entries):
+        where = f"entry {i + 1}"
+        if not isinstance(entry, dict):
+            errors.append(f"{where}: expected an object, not {json.dumps(entry)}")
+            continue
+        try:
+            day = parse_date(entry.get("date", ""))
+        except ValueError as e:
+            errors.append(f"{where}: {e}")
+            continue
+        if day < today:
+            continue
+        if ("trip_id" in entry) == ("route_id" in entry):
+            errors.append(f"{where}: give a trip_id or a route_id")
+            continue
+        if "trip_id" in entry:
+            candidates = trips.get(entry["trip_id"])
+            if candidates is None:
+                errors.append(f"{where}: unknown trip_id {entry['trip_id']!r}")
+                continue
+        else:
+            if entry["route_id"] not in routes:
+                errors.append(f"{where}: unknown route_id {entry['route_id']!r}")
+                continue
+            candidates = [
+                t for t in gen_gtfs.TRIPS if t["route_id"] == entry["route_id"]
+            ]
+        if not gen_gtfs.FEED_START <= day <= gen_gtfs.FEED_END:
+            errors.append(f"{where}: {day} is outside the feed")
+            continue
+        running = [t for t in candidates if services.runs(t["service_id"], day)]
+        if not running:
+            errors.append(
+                f"{where}: {entry.get('trip_id') or entry['route_id']} "
+                f"does not run on {day}"
+            )
+            continue
+        resolved.append({**entry, "date": day, "trips": running})
+    return resolved, errors
+
+
+def _service_day(day):
+    """Epoch seconds of noon minus 12h on day, the GTFS service-day origin."""
+    tz = ZoneInfo(gen_gtfs.AGENCY["agency_timezone"])
+    noon = datetime(day // 10000, day // 100 % 100, day % 100, 12, tzinfo=tz)
+    return int(noon.timestamp()) - 12 * 3600
+
+
+def _descriptor(descriptor, trip, day):
+    # Runs of a frequency-based trip share the trip_id of trips.txt
+    descriptor.trip_id = trip.get("feed_trip_id", trip["trip_id"])
+    descriptor.route_id = trip["route_id"]
+    descriptor.start_date = str(day)
+    descriptor.start_time = trip["stop_times"][0][0]
+    if "direction_id" in trip:
+        descriptor.direction_id = trip["direction_id"]
+
+
+def entities(resolved):
+    """{feed: {entity id: FeedEntity}} for the resolved entries."""
+    from google.transit import gtfs_realtime_pb2 as rt
+
+    result = {feed: {} for feed in FEEDS}
+    for entry in resolved:
+        day = entry["date"]
+        for trip in entry["trips"]:
+            start = trip["stop_times"][0][0].replace(":", "")[:4]
+            entity = rt.FeedEntity(id=f"{day}-{trip['trip_id']}-{start}")
+            update = entity.trip_update
+            _descriptor(update.trip, trip, day)
+            update.trip.schedule_relationship = rt.TripDescriptor.CANCELED
+            result["trip_updates"][entity.id] = entity
+
+        key = entry.get("trip_id") or entry["route_id"]
+        entity = rt.FeedEntity(id=f"{day}-{key}")
+        alert = entity.alert
+        origin = _service_day(day)
+        last = max(parse_time(t["stop_times"][-1][0]) for t in entry["trips"])
+        period = alert.active_period.add()
+        period.start = origin
+        period.end = origin + max(last, 24 * 3600)
+        if "trip_id" in entry:
+            for trip in entry["trips"]:
+                _descriptor(alert.informed_entity.add().trip, trip, day)
+        else:
+            selector = alert.informed_entity.add()
+            selector.agency_id = gen_gtfs.AGENCY_ID
+            selector.route_id = entry["route_id"]
+        alert.cause = rt.Alert.UNKNOWN_CAUSE
+        alert.effect = rt.Alert.NO_SERVICE
+        alert.header_text.translation.add(text=headline(entry), language="en")
+        if entry.get("message"):
+            alert.description_text.translation.add(
+                text=entry["message"], language="en"
+            )
+        result["alerts"][entity.id] = entity
+    return result
+
+
+def headline(entry):
+    """One line describing what an entry cancels, e.g. for the banner."""
+    day = entry["date"]
+    weekday = date(day // 10000, day // 100 % 100, day % 100).strftime("%A")
+    when = f"{weekday}, {format_date(day)}"
+    if "route_id" in entry:
+        route = next(r for r in gen_gtfs.ROUTES if r["route_id"] == entry["route_id"])
+        return f"{when}: all {route['route_long_name']} trips are cancelled"
+    trip = entry["trips"][0]
+    stops = {stop["stop_id"]: stop["stop_name"] for stop in gen_gtfs.STOPS}
+    first, last = trip["stop_times"][0], trip["stop_times"][-1]
+    return (
+        f"{when}: the {format_time(parse_time(first[0]))} trip from "
+        f"{stops[first[1]]} to {stops[last[1]]} is cancelled"
+    )
+
+
+def banner(resolved):
+    """The contents of cancellation_message.html."""
+    if not resolved:
+        return DEFAULT_BANNER + "\n"
+    lines = []
+    for entry in sorted(resolved, key=lambda e: e["date"]):
+        text = headline(entry)
+        if entry.get("message"):
+            text += f". {entry['message']}"
+        lines.append(html.escape(text))
+    return "<br>\n".join(lines) + "\n"
+
+
+def _digest(entity):
+    return hashlib.sha256(entity.SerializeToString(deterministic=True)).hexdigest()
+
+
+def feed_message(entities_, incrementality, timestamp):
+    from google.transit import gtfs_realtime_pb2 as rt
+
+    message = rt.FeedMessage()
+    message.header.gtfs_realtime_version = GTFS_RT_VERSION
+    message.header.incrementality = incrementality
+    message.header.timestamp = timestamp
+    message.entity.extend(entities_)
+    return message.SerializeToString(deterministic=True)
+
+
+def write_feeds(current, output=realtime_dir, timestamp=None):
+    """Write the full and differential feeds that changed; returns their paths."""
+    from google.transit import gtfs_realtime_pb2 as rt
+
+    state_path = output / "state.json"
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    written = []
+    output.mkdir(parents=True, exist_ok=True)
+    for feed in FEEDS:
+        digests = {key: _digest(entity) for key, entity in current[feed].items()}
+        previous = state.get(feed, {})
+        full_path = output / f"{feed}.pb"
+        if digests == previous and full_path.exists():
+            continue
+
+        changed = [
+            current[feed][key]
+            for key in sorted(digests)
+            if previous.get(key) != digests[key]
+        ]
+        deleted = [
+            rt.FeedEntity(id=key, is_deleted=True)
+            for key in sorted(previous)
+            if key not in digests
+        ]
+        full = [current[feed][key] for key in sorted(digests)]
+        full_path.write_bytes(
+            feed_message(full, rt.FeedHeader.FULL_DATASET, timestamp)
+        )
+        diff_path = output / f"{feed}-differential.pb"
+        diff_path.write_bytes(
+            feed_message(changed + deleted, rt.FeedHeader.DIFFERENTIAL, timestamp)
+        )
+        state[feed] = digests
+        written += [full_path, diff_path]
+    state_path.write_text(json.dumps(state, indent=1, sort_keys=True) + "\n")
+    return written
+
+
+def dump(path):
+    """A feed file as protobuf text, for checking by eye."""
+    from google.protobuf import text_format
+    from google.transit import gtfs_realtime_pb2 as rt
+
+    message = rt.FeedMessage()
+    message.ParseFromString(Path(path).read_bytes())
+    return text_format.MessageToString(message)
+
+
+def serve(directory, port):
+    """Serve directory over HTTP on localhost, for testing consumers offline."""
+    import functools
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(directory))
+    with ThreadingHTTPServer(("127.0.0.1", port), handler) as server:
+        print(f"serving {directory} at http://127.0.0.1:{port}/", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Write GTFS-Realtime feeds and the banner from cancellations.json."
+    )
+    parser.add_argument("--cancellations", type=Path, default=CANCELLATIONS)
+    parser.add_argument("-o", "--output", type=Path, default=realtime_dir)
+    parser.add_argument("--banner", type=Path, default=BANNER)
+    parser.add_argument(
+        "--today",
+        type=parse_date,
+        help="drop entries before this date (default: today in the agency's timezone)",
+    )
+    parser.add_argument(
+        "--now", type=int, help="feed header timestamp in epoch seconds (default: now)"
+    )
+    parser.add_argument("--serve", type=int, metavar="PORT", help="then serve the feeds")
+    parser.add_argument("--dump", type=Path, metavar="FILE", help="print a feed and exit")
+    args = parser.parse_args(argv)
+
+    if args.dump:
+        print(dump(args.dump), end="")
+        return 0
+
+    today = args.today
+    if today is None:
+        tz = ZoneInfo(gen_gtfs.AGENCY["agency_timezone"])
+        today = int(datetime.now(tz).strftime("%Y%m%d"))
+    resolved, errors = resolve(load_cancellations(args.cancellations), today)
+    if errors:
+        for error in errors:
+            print(f"{args.cancellations}: {error}", file=sys.stderr)
+        return 1
+
+    written = write_feeds(entities(resolved), args.output, args.now)
+    for feed in FEEDS:
+        path = args.output / f"{feed}.pb"
+        print(f"{path}: {'updated' if path in written else 'unchanged'}", file=sys.stderr)
+    text = banner(resolved)
+    if not args.banner.exists() or args.banner.read_text(encoding="utf-8") != text:
+        args.banner.write_text(text, encoding="utf-8")
+        print(f"{args.banner}: updated", file=sys.stderr)
+
+    if args.serve:
+        serve(args.output, args.serve)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Grid index of the segments of a line, for snapping points onto it.
+
+Segments are bucketed into square cells on a local plane, each into every
+cell its bounding box touches. A query only measures the segments in the
+cells around the point, so its cost follows the segments nearby rather
+than the length of the line.
+"""
+
+import numpy as np
+
+from simplify import segment_offsets
+
+# Side of a grid cell in metres
+CELL_M = 250
+
+# (point, segment) pairs measured at a time by nearest_many()
+PAIRS = 1 << 20
+
+
+class SegmentIndex:
+    """Segments of the projected line xy ((n, 2) metres), bucketed by cell."""
+
+    def __init__(self, xy, cell_m=CELL_M):
+        self.xy = np.asarray(xy, dtype=float)
+        self.cell_m = cell_m
+        self.origin = self.xy.min(axis=0)
+        a, b = self.xy[:-1], self.xy[1:]
+        low = self._cell(np.minimum(a, b))
+        high = self._cell(np.maximum(a, b))
+        self.width = int(high[:, 1].max(initial=0)) + 1
+
+        # Every (segment, cell) pair of each segment's bounding box, in one pass
+        span = high - low + 1
+        counts = span[:, 0] * span[:, 1]
+        segment = np.repeat(np.arange(len(a)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = low[segment, 0] + k // span[segment, 1]
+        cy = low[segment, 1] + k % span[segment, 1]
+        keys = cx * self.width + cy
+
+        order = np.argsort(keys, kind="stable")
+        self._keys, starts = np.unique(keys[order], return_index=True)
+        self._bounds = np.append(starts, len(order))
+        self._segments = segment[order]
+
+    def _cell(self, xy):
+        return np.floor((xy - self.origin) / self.cell_m).astype(np.int64)
+
+    def within(self, point, radius):
+        """Sorted indices of the segments in cells reaching within radius of point."""
+        low = np.maximum(self._cell(np.asarray(point) - radius), 0)
+        high = self._cell(np.asarray(point) + radius)
+        high[1] = min(high[1], self.width - 1)
+        if np.any(high < low):
+            return np.zeros(0, dtype=np.int64)
+        cx, cy = np.meshgrid(
+            np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1)
+        )
+        keys = (cx * self.width + cy).ravel()
+        at = np.searchsorted(self._keys, keys)
+        found = at < len(self._keys)
+        found[found] = self._keys[at[found]] == keys[found]
+        parts = [
+            self._segments[self._bounds[i] : self._bounds[i + 1]] for i in at[found]
+        ]
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def distances(self, point, segments):
+        """Distance from point to each of segments, and where along each is closest."""
+        a, b = self.xy[segments], self.xy[segments + 1]
+        return segment_offsets(np.asarray(point), a, b)
+
+    def nearest(self, point):
+        """Distance from point to the line, searching outwards cell by cell."""
+        point = np.asarray(point)
+        corners = np.abs([self.origin - point, self.xy.max(axis=0) - point])
+        farthest = np.hypot(*corners.max(axis=0))
+        radius = self.cell_m
+        while True:
+            segments = self.within(point, radius)
+            if len(segments):
+                dist = self.distances(point, segments)[0].min()
+                # A closer segment may lie just outside the cells searched
+                if dist <= radius or radius >= farthest:
+                    return float(dist)
+            radius *= 2
+
+    def candidates(self, point, margin):
+        """Sorted indices of the segments within margin of the nearest distance."""
+        return self.within(point, self.nearest(point) + margin)
+
+    def nearest_many(self, points):
+        """Distance from each of points ((m, 2) metres) to the line.
+
+        Each point is measured against the segments of the 3 x 3 cells around
+        it, all points in a few batches. Only a point further than a cell from
+        all of those is searched outwards with nearest(), as a closer segment
+        could then lie beyond them.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        cells = self._cell(points)
+        dx, dy = np.divmod(np.arange(9), 3)
+        nx, ny = cells[:, :1] + dx - 1, cells[:, 1:] + dy - 1
+        keys = nx * self.width + ny
+        at = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = (nx >= 0) & (ny >= 0) & (ny < self.width) & (self._keys[at] == keys)
+        point_of = np.repeat(np.arange(len(points)), 9)[found.ravel()]
+        cell_at = at[found]
+        counts = self._bounds[cell_at + 1] - self._bounds[cell_at]
+
+        # Blocks of whole points, each measuring about PAIRS pairs
+        per_point = np.bincount(point_of, weights=counts, minlength=len(points))
+        cuts = np.searchsorted(
+            np.cumsum(per_point), np.arange(PAIRS, counts.sum(), PAIRS)
+        )
+        result = np.full(len(points), np.inf)
+        for first, last in zip([0, *cuts], [*cuts, len(points)]):
+            lo, hi = np.searchsorted(point_of, [first, last])
+            if lo == hi:
+                continue
+            n = counts[lo:hi]
+            pair_point = np.repeat(point_of[lo:hi], n)
+            k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            segment = self._segments[np.repeat(self._bounds[cell_at[lo:hi]], n) + k]
+            dist = segment_offsets(
+                points[pair_point], self.xy[segment], self.xy[segment + 1]
+            )[0]
+            starts = np.flatnonzero(np.diff(pair_point, prepend=-1))
+            result[pair_point[starts]] = np.minimum.reduceat(dist, starts)
+        for i in np.flatnonzero(result > self.cell_m).tolist():
+            result[i] = self.nearest(points[i])
+        return result
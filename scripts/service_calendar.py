@@ -0,0 +1,173 @@
+"""Service calendar expanded into one bitset per service_id.
+
+Every service is expanded once over the feed window from its calendar.txt
+weekday pattern and its calendar_dates.txt exceptions. "Does service X run
+on day D" is then a single bit lookup.
+"""
+
+from datetime import date
+
+import numpy as np
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# calendar_dates.txt exception_type values
+ADDED = 1
+REMOVED = 2
+
+
+def to_day(value):
+    """A YYYYMMDD int or string, date, or datetime64 as numpy datetime64[D]."""
+    if isinstance(value, (int, np.integer, str)):
+        value = str(value)
+        value = f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+    elif isinstance(value, date):
+        value = value.isoformat()[:10]
+    return np.datetime64(value, "D")
+
+
+def to_yyyymmdd(days):
+    """Array of datetime64[D] as YYYYMMDD ints."""
+    days = np.asarray(days, dtype="datetime64[D]")
+    months = days.astype("datetime64[M]")
+    year = days.astype("datetime64[Y]").astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    return year * 10000 + month * 100 + day
+
+
+def weekday(days):
+    """Day of the week of datetime64[D] values, Monday = 0."""
+    # 1970-01-01 was a Thursday
+    return (days.astype(np.int64) + 3) % 7
+
+
+def nth_weekday_of_month(start, end, day_of_week, n=1):
+    """Dates between start and end that are the nth day_of_week of their month."""
+    days = np.arange(to_day(start), to_day(end) + 1)
+    day_of_month = (days - days.astype("datetime64[M]")).astype(np.int64) + 1
+    return days[(weekday(days) == day_of_week) & ((day_of_month - 1) // 7 == n - 1)]
+
+
+class ServiceCalendar:
+    """Per-day bitsets of the services in a feed, from start to end inclusive."""
+
+    def __init__(self, calendar, calendar_dates, start, end):
+        self.start = to_day(start)
+        self.end = to_day(end)
+        self.days = np.arange(self.start, self.end + 1)
+        self.service_ids = list(
+            dict.fromkeys(
+                [row["service_id"] for row in calendar]
+                + [row["service_id"] for row in calendar_dates]
+            )
+        )
+        self._index = {service_id: i for i, service_id in enumerate(self.service_ids)}
+        # The declared range of each calendar.txt service, kept for to_gtfs()
+        self._ranges = {
+            row["service_id"]: (row["start_date"], row["end_date"]) for row in calendar
+        }
+
+        active = np.zeros((len(self.service_ids), len(self.days)), dtype=bool)
+        if calendar:
+            rows = [self._index[row["service_id"]] for row in calendar]
+            pattern = np.array([[row[d] == 1 for d in WEEKDAYS] for row in calendar])
+            first = np.array([to_day(row["start_date"]) for row in calendar])
+            last = np.array([to_day(row["end_date"]) for row in calendar])
+            active[rows] = (
+                pattern[:, weekday(self.days)]
+                & (self.days >= first[:, None])
+                & (self.days <= last[:, None])
+            )
+        if calendar_dates:
+            rows = np.array([self._index[row["service_id"]] for row in calendar_dates])
+            offsets = np.array(
+                [to_day(row["date"]) - self.start for row in calendar_dates]
+            ).astype(np.int64)
+            added = np.array([row["exception_type"] == ADDED for row in calendar_dates])
+            inside = (offsets >= 0) & (offsets < len(self.days))
+            active[rows[inside], offsets[inside]] = added[inside]
+
+        self._bits = np.packbits(active, axis=1, bitorder="little")
+
+    def _offset(self, day):
+        offset = int((to_day(day) - self.start).astype(np.int64))
+        if not 0 <= offset < len(self.days):
+            raise ValueError(f"{day} is outside {self.start}..{self.end}")
+        return offset
+
+    def runs(self, service_id, day):
+        """Whether service_id runs on day."""
+        offset = self._offset(day)
+        byte = self._bits[self._index[service_id], offset >> 3]
+        return bool((byte >> (offset & 7)) & 1)
+
+    def mask(self, service_id, start=None, end=None):
+        """Boolean array of the days service_id runs, from start to end inclusive."""
+        first = 0 if start is None else self._offset(start)
+        last = len(self.days) - 1 if end is None else self._offset(end)
+        bits = np.unpackbits(
+            self._bits[self._index[service_id]], count=len(self.days), bitorder="little"
+        )
+        return bits[first : last + 1].astype(bool)
+
+    def matrix(self):
+        """(services, days) boolean array, rows in service_ids order."""
+        return np.unpackbits(
+            self._bits, axis=1, count=len(self.days), bitorder="little"
+        ).astype(bool)
+
+    def services_on(self, day):
+        """service_ids running on day."""
+        offset = self._offset(day)
+        column = (self._bits[:, offset >> 3] >> (offset & 7)) & 1
+        return [s for s, on in zip(self.service_ids, column) if on]
+
+    def dates(self, service_id):
+        """The days service_id runs, as datetime64[D]."""
+        return self.days[self.mask(service_id)]
+
+    def to_gtfs(self):
+        """calendar.txt and calendar_dates.txt rows that describe the bitsets.
+
+        Each service gets the weekday pattern that holds on most of its weeks,
+        with every day that differs from it written as an exception. Services
+        with no weekly pattern are written as added dates only.
+        """
+        calendar, calendar_dates = [], []
+        day_of_week = weekday(self.days)
+        for service_id, active in zip(self.service_ids, self.matrix()):
+            if service_id in self._ranges:
+                first, last = map(to_day, self._ranges[service_id])
+            elif active.any():
+                first, last = self.days[active][[0, -1]]
+            else:
+                continue
+            window = (self.days >= first) & (self.days <= last)
+            runs = np.bincount(day_of_week[window & active], minlength=7)
+            total = np.bincount(day_of_week[window], minlength=7)
+            pattern = runs * 2 > total
+
+            if pattern.any() or service_id in self._ranges:
+                calendar.append(
+                    {
+                        "service_id": service_id,
+                        **{d: int(on) for d, on in zip(WEEKDAYS, pattern)},
+                        "start_date": int(to_yyyymmdd(first)),
+                        "end_date": int(to_yyyymmdd(last)),
+                    }
+                )
+                expected = pattern[day_of_week] & window
+            else:
+                expected = np.zeros(len(self.days), dtype=bool)
+
+            differs = np.flatnonzero(active != expected)
+            for day, added in zip(to_yyyymmdd(self.days[differs]), active[differs]):
+                calendar_dates.append(
+                    {
+                        "service_id": service_id,
+                        "date": int(day),
+                        "exception_type": ADDED if added else REMOVED,
+                    }
+                )
+        return calendar, calendar_dates
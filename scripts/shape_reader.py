@@ -0,0 +1,67 @@
+"""Read the LineString of shape GeoJSON files straight into NumPy arrays.
+
+With orjson installed, files are decoded as plain dicts and lists and the
+coordinates go straight into an array, skipping the geojson object model.
+Without it, the geojson package reads them as before. Many files are read
+by a pool of worker processes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Below this many bytes in total, starting worker processes costs more than it saves
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+
+
+def _load(path):
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    import geojson
+
+    with open(path, "r", encoding="utf-8") as f:
+        return geojson.load(f)
+
+
+def line_coordinates(data, path="<geojson>"):
+    """Coordinates of the one LineString in a decoded GeoJSON object.
+
+    Point features, such as routing waypoints, are allowed beside it.
+    """
+    if data.get("type") == "FeatureCollection":
+        geometries = [feature.get("geometry") or {} for feature in data["features"]]
+    elif data.get("type") == "Feature":
+        geometries = [data.get("geometry") or {}]
+    else:
+        geometries = [data]
+    lines = [g for g in geometries if g.get("type") == "LineString"]
+    if len(lines) != 1:
+        found = ", ".join(g.get("type", "null") for g in geometries) or "no geometry"
+        raise ValueError(f"{path}: expected exactly one LineString, found {found}")
+
+    coords = np.array(lines[0]["coordinates"], dtype=float)
+    if coords.ndim != 2 or coords.shape[1] not in (2, 3) or len(coords) < 2:
+        raise ValueError(f"{path}: LineString needs two or more 2D or 3D positions")
+    return coords
+
+
+def read_line(path):
+    """(n, 2) or (n, 3) array of the LineString in the GeoJSON file at path."""
+    return line_coordinates(_load(path), path)
+
+
+def read_lines(paths, workers=None):
+    """Arrays of the LineStrings in paths, in order, read in parallel when it pays."""
+    paths = [os.fspath(p) for p in paths]
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1 or sum(map(os.path.getsize, paths)) < PARALLEL_MIN_BYTES:
+        return [read_line(path) for path in paths]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(read_line, paths, chunksize=max(1, len(paths) // (workers * 4))))
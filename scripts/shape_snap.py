@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+"""Offline upkeep of the shapes in scripts/shapes/, without re-routing on brouter.de.
+
+Every trip pattern's stops are snapped onto its shape at full resolution,
+and stops further than MAX_OFFSET_M from the line are reported. A shape is
+then mended locally instead of being routed again from scratch:
+
+  --spur       splices a spur from the line out to each far stop and back,
+               for a stop moved or added just off the road the bus takes
+  --splice     replaces the part of a shape between the ends of a piece of
+               line, e.g. a short detour drawn or routed by hand, with it
+
+    python shape_snap.py                        # report stops off their shapes
+    python shape_snap.py --spur WCCWB
+    python shape_snap.py --splice WCCWB detour.geojson
+"""
+
+import json
+import sys
+
+import numpy as np
+
+import gen_gtfs
+from linear_ref import cumulative_distance, snap_stops
+from segment_index import SegmentIndex
+from shape_reader import read_line
+from simplify import project
+from validate import MAX_SHAPE_OFFSET_M
+
+MAX_OFFSET_M = MAX_SHAPE_OFFSET_M
+
+# Feature properties that describe the old geometry point by point
+STALE_PROPERTIES = ("times", "messages")
+
+
+def snap_pattern(pattern):
+    """Where each stop of a pattern falls along its shape, and how far off it is."""
+    coords = read_line(gen_gtfs.shape_path(pattern["shape_id"]))
+    lookup = gen_gtfs.get_stop_lookup()
+    stop_ids = [stop_id for _, stop_id in pattern["stop_times"]]
+    for stop_id in stop_ids:
+        if stop_id not in lookup:
+            raise ValueError(
+                f"{pattern['trip_id']}: stop {stop_id} is not in stops.geojson, "
+                f"so it cannot be placed on shape {pattern['shape_id']}"
+            )
+    measures, offsets = snap_stops(coords, [lookup[s] for s in stop_ids])
+    return {
+        "trip_id": pattern["trip_id"],
+        "shape_id": pattern["shape_id"],
+        "stop_ids": stop_ids,
+        "measures": measures,
+        "offsets": offsets,
+    }
+
+
+def far_stops(shape_ids=None, max_offset=MAX_OFFSET_M):
+    """Stops further than max_offset from the shape of their trip pattern."""
+    names = {stop["stop_id"]: stop["stop_name"] for stop in gen_gtfs.STOPS}
+    issues = []
+    for pattern in gen_gtfs.TRIP_PATTERNS:
+        if "shape_id" not in pattern or (
+            shape_ids and pattern["shape_id"] not in shape_ids
+        ):
+            continue
+        snapped = snap_pattern(pattern)
+        for sequence, (stop_id, measure, offset) in enumerate(
+            zip(snapped["stop_ids"], snapped["measures"], snapped["offsets"])
+        ):
+            if offset > max_offset:
+                issues.append(
+                    {
+                        "trip_id": pattern["trip_id"],
+                        "shape_id": pattern["shape_id"],
+                        "stop_sequence": sequence,
+                        "stop_id": stop_id,
+                        "stop_name": names.get(stop_id),
+                        "offset_m": round(float(offset), 1),
+                        "measure_m": round(float(measure), 1),
+                    }
+                )
+    return issues
+
+
+def point_at(coords, measure, m):
+    """The point m metres along coords, interpolating every column (such as height)."""
+    return np.array([np.interp(m, measure, column) for column in coords.T])
+
+
+def cut(coords, start_m, end_m):
+    """The part of coords from start_m to end_m metres along it, ends interpolated."""
+    measure = cumulative_distance(coords[:, :2])
+    inside = (measure > start_m) & (measure < end_m)
+    start, end = point_at(coords, measure, start_m), point_at(coords, measure, end_m)
+    return np.vstack((start, coords[inside], end))
+
+
+def _locate(coords, point):
+    """Metres along coords of the position closest to point."""
+    lat0 = coords[:, 1].mean()
+    xy = project(coords[:, :2], lat0)
+    pxy = project(np.asarray(point, dtype=float)[None, :2], lat0)[0]
+    index = SegmentIndex(xy)
+    segments = index.within(pxy, index.nearest(pxy) + 1e-6)
+    dist, t = index.distances(pxy, segments)
+    best = dist.argmin()
+    measure = cumulative_distance(coords[:, :2])
+    i = segments[best]
+    return measure[i] + t[best] * (measure[i + 1] - measure[i])
+
+
+def splice(coords, piece):
+    """coords with the stretch between piece's ends swapped for piece."""
+    piece = np.asarray(piece, dtype=float)
+    start, end = _locate(coords, piece[0]), _locate(coords, piece[-1])
+    if end < start:
+        raise ValueError("the piece runs against the direction of the shape")
+    if coords.shape[1] > piece.shape[1]:
+        # Heights of the new points, graded between the line at either end
+        measure = cumulative_distance(coords[:, :2])
+        ends = point_at(coords, measure, start), point_at(coords, measure, end)
+        share = np.linspace(0, 1, len(piece))[:, None]
+        first, last = (e[piece.shape[1] :] for e in ends)
+        piece = np.hstack((piece, first * (1 - share) + last * share))
+    total = cumulative_distance(coords[:, :2])[-1]
+    return np.vstack((cut(coords, 0, start)[:-1], piece, cut(coords, end, total)[1:]))
+
+
+def spur(coords, measure_m, stop_lonlat):
+    """coords with an out-and-back spur to a stop at measure_m metres along it."""
+    measure = cumulative_distance(coords[:, :2])
+    at = point_at(coords, measure, measure_m)
+    tip = np.concatenate((stop_lonlat, at[2:]))
+    before = cut(coords, 0, measure_m)[:-1]
+    after = cut(coords, measure_m, measure[-1])[1:]
+    return np.vstack((before, at, tip, at, after))
+
+
+def add_spurs(shape_id, issues):
+    """The shape with a spur to every far stop in issues, from the last one back."""
+    coords = read_line(gen_gtfs.shape_path(shape_id))
+    lookup = gen_gtfs.get_stop_lookup()
+    # Spurs lengthen the line after them, so earlier measures stay valid
+    for issue in sorted(issues, key=lambda i: i["measure_m"], reverse=True):
+        coords = spur(coords, issue["measure_m"], lookup[issue["stop_id"]])
+    return coords
+
+
+def write_shape(shape_id, coords):
+    """Replace the LineString of a shape file, keeping its other features."""
+    path = gen_gtfs.shape_path(shape_id)
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    features = data["features"] if data.get("type") == "FeatureCollection" else [data]
+    for feature in features:
+        if (feature.get("geometry") or {}).get("type") == "LineString":
+            feature["geometry"]["coordinates"] = np.round(coords, 6).tolist()
+            properties = feature.setdefault("properties", {})
+            for key in STALE_PROPERTIES:
+                properties.pop(key, None)
+            if "track-length" in properties:
+                length = cumulative_distance(coords[:, :2])[-1]
+                properties["track-length"] = str(int(round(length)))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, indent=2))
+    return path
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Snap stops onto shapes, mend shapes.")
+    parser.add_argument("shape_ids", nargs="*", metavar="SHAPE_ID")
+    parser.add_argument(
+        "--max-offset",
+        type=float,
+        default=MAX_OFFSET_M,
+        metavar="METRES",
+        help="report stops further than this from their shape (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--spur", action="store_true", help="splice a spur out to every far stop"
+    )
+    parser.add_argument(
+        "--splice",
+        nargs=2,
+        metavar=("SHAPE_ID", "GEOJSON"),
+        help="splice the LineString in GEOJSON into the shape",
+    )
+    args = parser.parse_args(argv)
+
+    if args.splice:
+        shape_id, piece = args.splice
+        try:
+            coords = splice(read_line(gen_gtfs.shape_path(shape_id)), read_line(piece))
+        except ValueError as e:
+            print(f"{piece}: not spliced into shape {shape_id}: {e}", file=sys.stderr)
+            return 1
+        print(f"{write_shape(shape_id, coords)}: updated", file=sys.stderr)
+        args.shape_ids = args.shape_ids or [shape_id]
+
+    try:
+        issues = far_stops(args.shape_ids, args.max_offset)
+        if args.spur and issues:
+            by_shape = {}
+            for issue in issues:
+                by_shape.setdefault(issue["shape_id"], {})[issue["measure_m"]] = issue
+            for shape_id, spurs in by_shape.items():
+                path = write_shape(shape_id, add_spurs(shape_id, spurs.values()))
+                print(f"{path}: updated", file=sys.stderr)
+            issues = far_stops(args.shape_ids, args.max_offset)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    for issue in issues:
+        print(
+            f"{issue['trip_id']}: stop {issue['stop_sequence']} "
+            f"({issue['stop_name']}) is {issue['offset_m']} m from shape "
+            f"{issue['shape_id']}",
+            file=sys.stderr,
+        )
+    return 1 if issues else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Douglas–Peucker simplification of shape LineStrings with a tolerance in metres.
+
+Coordinates are projected onto a local equirectangular plane, which is
+accurate to well under a metre at the scale of a single route.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def project(lonlat, lat0=None):
+    """Project an (n, 2) array of lon/lat degrees onto a local plane in metres.
+
+    The plane is centred on latitude lat0 (degrees), by default the mean.
+    """
+    rad = np.radians(lonlat)
+    lat0 = rad[:, 1].mean() if lat0 is None else np.radians(lat0)
+    return np.column_stack(
+        (rad[:, 0] * np.cos(lat0) * EARTH_RADIUS_M, rad[:, 1] * EARTH_RADIUS_M)
+    )
+
+
+def segment_offsets(points, a, b):
+    """Distance from points to the segments a..b, and how far along each is closest.
+
+    The arrays broadcast against each other over their leading axes; the
+    fraction along a segment runs from 0 at a to 1 at b.
+    """
+    ab = b - a
+    ap = points - a
+    length2 = np.einsum("...j,...j->...", ab, ab)
+    dot = np.einsum("...j,...j->...", ap, ab)
+    t = np.clip(
+        np.divide(dot, length2, out=np.zeros(dot.shape), where=length2 > 0), 0, 1
+    )
+    nearest = ap - ab * t[..., None]
+    return np.hypot(nearest[..., 0], nearest[..., 1]), t
+
+
+def segment_distances(xy, start, end):
+    """Distance from each point xy[i] to the segment xy[start[i]]..xy[end[i]]."""
+    return segment_offsets(xy, xy[start], xy[end])[0]
+
+
+def line_distances(points, line):
+    """Distance from each point to the nearest segment of the polyline line."""
+    if len(line) < 2:
+        return np.hypot(*(points - line[:1]).T)
+    a, b = line[:-1], line[1:]
+    distances = np.empty(len(points))
+    # Bound the (points, segments) block to a few MB
+    step = max(1, 250_000 // len(a))
+    for start in range(0, len(points), step):
+        block = points[start : start + step, None, :]
+        distances[start : start + step] = segment_offsets(block, a, b)[0].min(axis=1)
+    return distances
+
+
+def _deviations(xy, keep):
+    """Distance from every point to the kept segment it falls within."""
+    anchors = np.flatnonzero(keep)
+    seg = np.searchsorted(anchors, np.arange(len(xy)), side="right") - 1
+    end = anchors[np.minimum(seg + 1, len(anchors) - 1)]
+    return segment_distances(xy, anchors[seg], end), seg
+
+
+def douglas_peucker(xy, tolerance):
+    """Boolean mask of the vertices of xy kept within tolerance.
+
+    Every segment is split in the same pass, so the loop runs once per level
+    of the recursion rather than once per segment.
+    """
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[[0, -1]] = True
+    if tolerance <= 0:
+        keep[:] = True
+        return keep
+
+    while True:
+        d, seg = _deviations(xy, keep)
+        d[keep] = 0
+        worst = np.full(seg[-1] + 1, -1.0)
+        np.maximum.at(worst, seg, d)
+        split = np.flatnonzero((d > tolerance) & (d == worst[seg]))
+        if not len(split):
+            return keep
+        # Only the first farthest point of each segment
+        _, first = np.unique(seg[split], return_index=True)
+        keep[split[first]] = True
+
+
+def simplify(lonlat, tolerance_m, decimals=None):
+    """Simplify an (n, 2) lon/lat array and round it to decimals places.
+
+    Returns the simplified array and a report of the vertex counts and the
+    largest distance, in metres, from an original vertex to the line before
+    and after rounding.
+    """
+    lonlat = np.asarray(lonlat, dtype=float)[:, :2]
+    lat0 = lonlat[:, 1].mean()
+    xy = project(lonlat, lat0)
+    keep = douglas_peucker(xy, tolerance_m)
+    simplified_deviation, _ = _deviations(xy, keep)
+
+    simplified = lonlat[keep]
+    if decimals is not None:
+        simplified = np.round(simplified, decimals)
+
+    # Original vertices measured against the rounded line
+    rounded_xy = xy.copy()
+    rounded_xy[keep] = project(simplified, lat0)
+    deviation, _ = _deviations(rounded_xy, keep)
+    deviation[keep] = np.hypot(*(rounded_xy[keep] - xy[keep]).T)
+
+    return simplified, {
+        "vertices_before": len(lonlat),
+        "vertices_after": len(simplified),
+        "max_deviation_before_rounding_m": round(float(simplified_deviation.max()), 3),
+        "max_deviation_m": round(float(deviation.max()), 3),
+    }
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+"""Nearest-stop and radius queries over stops.geojson.
+
+Stops are bucketed into one uniform grid of square cells on a local plane,
+sized to about one stop per cell. A batch of points searches outwards ring
+by ring: each step gathers the stops of the next ring of cells around every
+point still pending. A point is done once its k-th nearest candidate is
+closer than any stop beyond the rings searched can be, measured on the
+sphere to the meridians and parallels bounding them. A point outside the
+grid starts at the first ring that reaches it, and no ring extends past the
+grid, so a far point costs at most the cells of the grid. Candidates are
+ranked by exact great-circle distance, using dot products of unit vectors.
+
+    python stop_index.py -67.76 44.64 -k 3
+"""
+
+import json
+import sys
+
+import numpy as np
+
+from simplify import EARTH_RADIUS_M, project
+
+# Stops closer than this are reported as near-duplicates
+DUPLICATE_M = 25
+
+# Points per block in batch queries, to bound memory
+CHUNK = 16384
+
+# Up to this many stops, batch queries compare every point with every stop
+SCAN_ALL = 256
+
+
+def unit_vectors(lon, lat):
+    """(n, 3) unit vectors of lon/lat degrees on the sphere."""
+    lon, lat = np.radians(lon), np.radians(lat)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def _metres(dot):
+    return EARTH_RADIUS_M * np.arccos(np.clip(dot, -1, 1))
+
+
+def _expand(starts, counts):
+    """The runs starts[i], starts[i] + 1, ... of counts[i] items, concatenated."""
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(counts.sum()) - offsets
+
+
+def _box_angle(lon, lat, low, high):
+    """Great-circle angle from each point outside a lon/lat box to the box, in radians.
+
+    A parallel edge comes closest at the longitude nearest the point's. A
+    meridian edge comes closest where its great circle does, clipped to the
+    edge.
+    """
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    nearest = np.cos(lon - np.clip(lon, low[:, 0], high[:, 0]))
+    # Cosines of the angle to the nearest point of each edge
+    cos = [
+        sin_lat * np.sin(low[:, 1]) + cos_lat * np.cos(low[:, 1]) * nearest,
+        sin_lat * np.sin(high[:, 1]) + cos_lat * np.cos(high[:, 1]) * nearest,
+    ]
+    for edge in (low[:, 0], high[:, 0]):
+        across = cos_lat * np.cos(lon - edge)
+        foot = np.clip(np.arctan2(sin_lat, across), low[:, 1], high[:, 1])
+        cos.append(sin_lat * np.sin(foot) + across * np.cos(foot))
+    return np.arccos(np.clip(np.max(cos, axis=0), -1, 1))
+
+
+def _top_k(dot, k):
+    """Columns of the k largest values in each row of dot, largest first."""
+    if k == 1:
+        return dot.argmax(axis=1)[:, None]
+    if k < dot.shape[1]:
+        top = np.argpartition(-dot, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(dot.shape[1]), dot.shape)
+    order = np.argsort(-np.take_along_axis(dot, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+class StopIndex:
+    """A grid of stops with stop_id, stop_lat and stop_lon, for nearest-stop queries.
+
+    cell_m defaults to the side that gives about one cell per stop.
+    """
+
+    def __init__(self, stops, cell_m=None):
+        self.stop_ids = [stop["stop_id"] for stop in stops]
+        lonlat = np.array([[s["stop_lon"], s["stop_lat"]] for s in stops], dtype=float)
+        self._lonlat = lonlat
+        self._lat0 = lonlat[:, 1].mean()
+        self._vectors = unit_vectors(lonlat[:, 0], lonlat[:, 1])
+        # Metres on the plane per radian of longitude and of latitude
+        self._per_radian = EARTH_RADIUS_M * np.cos(np.radians([self._lat0, 0]))
+
+        xy = project(lonlat, self._lat0)
+        self.origin = xy.min(axis=0)
+        extent = np.ptp(xy, axis=0)
+        if cell_m is None:
+            cell_m = max(np.sqrt(extent.prod() / len(stops)), extent.max() / len(stops))
+        self.cell_m = max(cell_m, 1.0)
+        cells = self._cell(xy)
+        self.shape = cells.max(axis=0) + 1
+        # Stops sorted by cell; cell key's lie at _starts[key]:_starts[key + 1]
+        keys = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self._order = np.argsort(keys, kind="stable")
+        self._starts = np.searchsorted(
+            keys[self._order], np.arange(self.shape.prod() + 1)
+        )
+
+    def _cell(self, xy):
+        return np.floor((xy - self.origin) / self.cell_m).astype(np.int64)
+
+    def _column(self, x, y_low, y_high):
+        """(run, stop) pairs for the stops in cells (x, y_low..y_high) of each run.
+
+        The cells of a column are consecutive keys, so their stops are one
+        slice of _order.
+        """
+        start = self._starts[x * self.shape[1] + y_low]
+        counts = self._starts[x * self.shape[1] + y_high + 1] - start
+        run = np.repeat(np.arange(len(x)), counts)
+        return run, self._order[_expand(start, counts)]
+
+    def _annulus(self, cells, inner, outer):
+        """(point, stop) pairs for the stops in the cells more than inner and at
+        most outer cells from each point's cell, along either axis.
+
+        Columns further than inner from the point are taken whole, the
+        others only above and below inner, each clipped to the grid.
+        """
+        x, y = cells.T
+        nx, ny = self.shape
+        low, high = np.maximum(x - outer, 0), np.minimum(x + outer, nx - 1)
+        counts = np.maximum(high - low + 1, 0)
+        point = np.repeat(np.arange(len(cells)), counts)
+        column = _expand(low, counts)
+        y, inner, outer = y[point], inner[point], outer[point]
+        near = np.abs(column - x[point]) <= inner
+        runs = [
+            (~near, y - outer, y + outer),
+            (near, y - outer, y - inner - 1),
+            (near, y + inner + 1, y + outer),
+        ]
+        pairs = []
+        for which, y_low, y_high in runs:
+            y_low, y_high = np.maximum(y_low, 0), np.minimum(y_high, ny - 1)
+            which = which & (y_low <= y_high)
+            run, stop = self._column(column[which], y_low[which], y_high[which])
+            pairs.append((point[which][run], stop))
+        return tuple(np.concatenate(p) for p in zip(*pairs))
+
+    def _reach(self, lon, lat, cells, ring):
+        """Metres on the sphere from each point to the stops beyond its ring.
+
+        The cells left beyond the ring are the columns either side of it and
+        the cells above and below it, each a box of longitude and latitude.
+        """
+        low = np.maximum(cells - ring[:, None], 0)
+        high = np.minimum(cells + ring[:, None], self.shape - 1)
+        (x0, y0), (x1, y1) = low.T, high.T
+        first, (nx, ny) = np.zeros_like(x0), self.shape - 1
+        boxes = [
+            ((first, first), (x0 - 1, first + ny)),
+            ((x1 + 1, first), (first + nx, first + ny)),
+            ((x0, first), (x1, y0 - 1)),
+            ((x0, y1 + 1), (x1, first + ny)),
+        ]
+        lon, lat = np.radians(lon), np.radians(lat)
+        reach = np.full(len(cells), np.inf)
+        for a, b in boxes:
+            a, b = np.column_stack(a), np.column_stack(b)
+            angle = _box_angle(lon, lat, self._corner(a), self._corner(b + 1))
+            reach = np.where(np.all(a <= b, axis=1), np.minimum(reach, angle), reach)
+        return reach * EARTH_RADIUS_M
+
+    def _corner(self, cells):
+        """Longitude and latitude in radians of the low corner of cells."""
+        return (self.origin + cells * self.cell_m) / self._per_radian
+
+    def _search(self, lon, lat, vectors, k):
+        """Indices and dot products of the k nearest stops, searching ring by ring."""
+        n = len(lon)
+        cells = self._cell(project(np.column_stack((lon, lat)), self._lat0))
+        index = np.full((n, k), -1, dtype=np.int64)
+        dot = np.full((n, k), -2.0)
+        pending = np.arange(n)
+        # First every cell out to the first ring that reaches the grid
+        ring = np.maximum(np.maximum(-cells, cells - (self.shape - 1)).max(axis=1), 1)
+        point, stop = self._annulus(cells, np.full(n, -1), ring)
+        while len(pending):
+            found = np.einsum("ij,ij->i", vectors[pending][point], self._vectors[stop])
+            # Best first within each point; CHUNK points fit uint16, which
+            # numpy sorts stably by radix
+            order = np.argsort(-found)
+            order = order[np.argsort(point[order].astype(np.uint16), kind="stable")]
+            point, stop, found = point[order], stop[order], found[order]
+            rank = np.arange(len(point)) - np.searchsorted(point, point)
+            keep = rank < k
+
+            # Merge the k best found with the k best so far
+            top_index = np.full((len(pending), k), -1, dtype=np.int64)
+            top_dot = np.full((len(pending), k), -2.0)
+            top_index[point[keep], rank[keep]] = stop[keep]
+            top_dot[point[keep], rank[keep]] = found[keep]
+            top_index = np.hstack((index[pending], top_index))
+            top_dot = np.hstack((dot[pending], top_dot))
+            best = _top_k(top_dot, k)
+            index[pending] = np.take_along_axis(top_index, best, axis=1)
+            dot[pending] = np.take_along_axis(top_dot, best, axis=1)
+
+            c, r = cells[pending], ring[pending]
+            reach = self._reach(lon[pending], lat[pending], c, r)
+            # A metre of slack for rounding in arccos
+            left = _metres(dot[pending, -1]) + 1 > reach
+            pending, c, r = pending[left], c[left], r[left] + 1
+            ring[pending] = r
+            point, stop = self._annulus(c, r - 1, r)
+        return index, dot
+
+    def nearest_batch(self, lon, lat, k=1):
+        """Indices and distances in metres of the k nearest stops to each point.
+
+        lon and lat are arrays of degrees; both results have shape (n, k).
+        """
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        k = min(k, len(self.stop_ids))
+        index = np.empty((len(lon), k), dtype=np.int64)
+        dot = np.empty((len(lon), k))
+        vectors = unit_vectors(lon, lat)
+
+        # Scanning a handful of stops beats the grid
+        if len(self.stop_ids) <= SCAN_ALL:
+            step = max(1, CHUNK * 8 // len(self.stop_ids))
+            for start in range(0, len(lon), step):
+                rows = slice(start, start + step)
+                all_dot = vectors[rows] @ self._vectors.T
+                top = _top_k(all_dot, k)
+                index[rows] = top
+                dot[rows] = np.take_along_axis(all_dot, top, axis=1)
+            return index, _metres(dot)
+
+        for start in range(0, len(lon), CHUNK):
+            rows = slice(start, start + CHUNK)
+            index[rows], dot[rows] = self._search(
+                lon[rows], lat[rows], vectors[rows], k
+            )
+        return index, _metres(dot)
+
+    def nearest(self, lon, lat, k=1):
+        """The k nearest stops to a point as (stop_id, metres) pairs."""
+        index, metres = self.nearest_batch([lon], [lat], k)
+        return [(self.stop_ids[i], float(m)) for i, m in zip(index[0], metres[0])]
+
+    def within(self, lon, lat, radius_m):
+        """Stops within radius_m of a point as (stop_id, metres), nearest first."""
+        vector = unit_vectors([lon], [lat])[0]
+        cell = self._cell(project(np.array([[lon, lat]], dtype=float), self._lat0))
+        # Rings doubling until the stops beyond them are out of reach
+        ring = np.ones(1, dtype=np.int64)
+        while self._reach([lon], [lat], cell, ring)[0] < radius_m:
+            ring *= 2
+        _, found = self._annulus(cell, np.full(1, -1), ring)
+        metres = _metres(self._vectors[found] @ vector)
+        found, metres = found[metres <= radius_m], metres[metres <= radius_m]
+        order = np.lexsort((found, metres))
+        return [
+            (self.stop_ids[i], float(m)) for i, m in zip(found[order], metres[order])
+        ]
+
+    def near_duplicates(self, threshold_m=DUPLICATE_M):
+        """Pairs of stops closer than threshold_m, as (stop_id, stop_id, metres)."""
+        if len(self.stop_ids) < 2:
+            return []
+        index, metres = self.nearest_batch(*self._lonlat.T, k=2)
+        # A stop at the same spot as another may rank behind it
+        itself = index[:, 0] == np.arange(len(index))
+        other = np.where(itself, index[:, 1], index[:, 0])
+        metres = np.where(itself, metres[:, 1], metres[:, 0])
+        return [
+            (self.stop_ids[i], self.stop_ids[j], float(metres[i]))
+            for i, j in enumerate(other)
+            if metres[i] <= threshold_m and (i < j or other[j] != i)
+        ]
+
+
+def check_stops(stops, threshold_m=DUPLICATE_M):
+    """Warnings about duplicate stop_ids and stops closer than threshold_m."""
+    warnings = []
+    seen = set()
+    for stop in stops:
+        if stop["stop_id"] in seen:
+            warnings.append(f"duplicate stop_id {stop['stop_id']}")
+        seen.add(stop["stop_id"])
+    for a, b, metres in StopIndex(stops).near_duplicates(threshold_m):
+        warnings.append(f"stops {a} and {b} are {metres:.1f} m apart")
+    return warnings
+
+
+def load():
+    """Index of the stops in stops.geojson."""
+    import gen_gtfs
+
+    return StopIndex(gen_gtfs.STOPS)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find the stops nearest a point.")
+    parser.add_argument("lon", type=float)
+    parser.add_argument("lat", type=float)
+    parser.add_argument("-k", type=int, default=1, help="number of stops")
+    parser.add_argument("--radius", type=float, help="all stops within this many metres")
+    args = parser.parse_args(argv)
+
+    index = load()
+    if args.radius is not None:
+        found = index.within(args.lon, args.lat, args.radius)
+    else:
+        found = index.nearest(args.lon, args.lat, args.k)
+    print(json.dumps([{"stop_id": s, "metres": round(m, 1)} for s, m in found], indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+import realtime
+
+rt = pytest.importorskip("google.transit.gtfs_realtime_pb2")
+
+TODAY = 20250901
+NOW = 1756700000
+
+
+@pytest.mark.parametrize(
+    "entry, error",
+    [
+        ({"date": "2025-09-02", "trip_id": "NOPE"}, "unknown trip_id 'NOPE'"),
+        ({"date": "2025-09-02", "route_id": "NOPE"}, "unknown route_id 'NOPE'"),
+        ({"date": "2025-09-02", "route_id": "ELLS"}, "ELLS does not run on 20250902"),
+        ({"date": "2030-01-07", "route_id": "ELLS"}, "20300107 is outside the feed"),
+        ({"date": "2025-09-02"}, "give a trip_id or a route_id"),
+        ({"date": "2025-09-31", "route_id": "ELLS"}, "no such date '2025-09-31'"),
+        ("2025-09-02 WCCWB", 'expected an object, not "2025-09-02 WCCWB"'),
+    ],
+)
+def test_resolve_errors(entry, error):
+    resolved, errors = realtime.resolve([entry], TODAY)
+    assert resolved == []
+    assert errors == [f"entry 1: {error}"]
+
+
+def test_resolve_drops_past_entries():
+    entries = [
+        {"date": "2025-08-26", "trip_id": "NOPE"},
+        {"date": "2025-09-08", "route_id": "ELLS"},
+    ]
+    resolved, errors = realtime.resolve(entries, TODAY)
+    assert errors == []
+    assert [entry["date"] for entry in resolved] == [20250908]
+    assert {trip["trip_id"] for trip in resolved[0]["trips"]} == {"ELLSEB", "ELLSWB"}
+
+
+def _run(tmp_path, entries, now):
+    cancellations = tmp_path / "cancellations.json"
+    cancellations.write_text(json.dumps(entries))
+    argv = [
+        f"--cancellations={cancellations}",
+        f"--output={tmp_path / 'realtime'}",
+        f"--banner={tmp_path / 'banner.html'}",
+        f"--today={TODAY}",
+        f"--now={now}",
+    ]
+    assert realtime.main(argv) == 0
+
+
+def _read(tmp_path, name):
+    message = rt.FeedMessage()
+    message.ParseFromString((tmp_path / "realtime" / name).read_bytes())
+    return message
+
+
+def test_write_feeds(tmp_path, capsys):
+    wcc = {"date": "2025-09-02", "trip_id": "WCCWB", "message": "Driver illness"}
+    ells = {"date": "2025-09-08", "route_id": "ELLS"}
+    _run(tmp_path, [wcc, ells], NOW)
+
+    full = _read(tmp_path, "alerts.pb")
+    assert full.header.incrementality == rt.FeedHeader.FULL_DATASET
+    assert full.header.timestamp == NOW
+    assert [e.id for e in full.entity] == ["20250902-WCCWB", "20250908-ELLS"]
+    assert full.entity[0].alert.description_text.translation[0].text == (
+        "Driver illness"
+    )
+    assert full.entity[1].alert.informed_entity[0].route_id == "ELLS"
+    trips = _read(tmp_path, "trip_updates.pb")
+    assert len(trips.entity) == 3
+    for entity in trips.entity:
+        assert entity.trip_update.trip.schedule_relationship == (
+            rt.TripDescriptor.CANCELED
+        )
+
+    # A changed message and a withdrawn route reach the differential feed
+    wcc["message"] = "Bus breakdown"
+    _run(tmp_path, [wcc], NOW + 60)
+    diff = _read(tmp_path, "alerts-differential.pb")
+    assert diff.header.incrementality == rt.FeedHeader.DIFFERENTIAL
+    assert diff.header.timestamp == NOW + 60
+    assert [(e.id, e.is_deleted) for e in diff.entity] == [
+        ("20250902-WCCWB", False),
+        ("20250908-ELLS", True),
+    ]
+    assert diff.entity[0].alert.description_text.translation[0].text == (
+        "Bus breakdown"
+    )
+    diff = _read(tmp_path, "trip_updates-differential.pb")
+    assert all(e.is_deleted for e in diff.entity) and len(diff.entity) == 2
+    assert [e.id for e in _read(tmp_path, "alerts.pb").entity] == ["20250902-WCCWB"]
+
+    # Nothing changed: neither feed is rewritten
+    before = {
+        path.name: path.read_bytes() for path in (tmp_path / "realtime").iterdir()
+    }
+    capsys.readouterr()
+    _run(tmp_path, [wcc], NOW + 120)
+    after = {
+        path.name: path.read_bytes() for path in (tmp_path / "realtime").iterdir()
+    }
+    assert after == before
+    err = capsys.readouterr().err
+    assert err.count(": unchanged") == 2 and "updated" not in err
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import timetable
+from service_calendar import WEEKDAYS, ServiceCalendar
+
+
+def test_last_stop_is_not_a_departure():
+    table = timetable.load()
+    for stops in table.trip_stops:
+        departures = table.next_departures(stops[-1], datetime(2025, 9, 2), n=50)
+        assert all(d["later_stops"] for d in departures), departures
+
+
+def test_first_stop_departs_with_every_later_stop():
+    table = timetable.load()
+    trip = table.trips[0]
+    stops = table.trip_stops[0]
+    departures = table.next_departures(stops[0], datetime(2025, 9, 2), n=50, days=7)
+    mine = [d for d in departures if d["trip_id"] == trip["trip_id"]]
+    assert mine
+    assert [s["stop_id"] for s in mine[0]["later_stops"]] == stops[1:]
+
+
+def test_departures_after_midnight_are_in_time_order():
+    calendar = ServiceCalendar(
+        [
+            {
+                "service_id": "DAILY",
+                **{day: 1 for day in WEEKDAYS},
+                "start_date": 20250901,
+                "end_date": 20250930,
+            }
+        ],
+        [],
+        20250901,
+        20250930,
+    )
+    trips = [
+        {
+            "trip_id": trip_id,
+            "route_id": "R",
+            "service_id": "DAILY",
+            "direction_id": 0,
+            "stop_times": [(first, "A"), (second, "B")],
+        }
+        for trip_id, first, second in [
+            ("LATE", "25:10:00", "25:30:00"),
+            ("EARLY", "00:30:00", "00:50:00"),
+            ("MORNING", "06:00:00", "06:20:00"),
+        ]
+    ]
+    routes = [{"route_id": "R", "route_long_name": "Route"}]
+    stops = [{"stop_id": "A", "stop_name": "A"}, {"stop_id": "B", "stop_name": "B"}]
+    table = timetable.Timetable(trips, routes, stops, calendar)
+
+    departures = table.next_departures("A", datetime(2025, 9, 10), n=4)
+    assert [(d["trip_id"], d["departure"]) for d in departures] == [
+        ("EARLY", datetime(2025, 9, 10, 0, 30)),
+        ("LATE", datetime(2025, 9, 10, 1, 10)),
+        ("MORNING", datetime(2025, 9, 10, 6, 0)),
+        ("EARLY", datetime(2025, 9, 11, 0, 30)),
+    ]
@@ -0,0 +1,52 @@
+import pytest
+
+from trip_patterns import ExpandedTrips
+
+PATTERN = {
+    "route_id": "R",
+    "service_id": "S",
+    "trip_id": "T",
+    "stop_times": [("08:00", "A"), ("08:10", "B")],
+}
+
+
+def test_frequency_runs_have_their_own_trip_ids():
+    pattern = {
+        **PATTERN,
+        "frequencies": [
+            {"start_time": "08:00", "end_time": "09:00", "headway_secs": 1200}
+        ],
+    }
+    trips = ExpandedTrips([pattern]).legacy_trips()
+    assert [t["trip_id"] for t in trips] == ["T-0800", "T-0820", "T-0840"]
+    assert {t["feed_trip_id"] for t in trips} == {"T"}
+    assert [t["stop_times"][1][0] for t in trips] == ["08:10:00", "08:30:00", "08:50:00"]
+
+
+def test_unreadable_pattern_is_left_out():
+    bad = {**PATTERN, "trip_id": "U", "stop_times": [("8h", "A"), ("08:10", "B")]}
+    expanded = ExpandedTrips([bad, PATTERN])
+    assert [t["trip_id"] for t in expanded.trips] == ["T"]
+    assert expanded.errors == ["U: malformed time '8h'"]
+    assert expanded.stop_ids[expanded.pattern_stops(1)] == ["A", "B"]
+
+
+@pytest.mark.parametrize(
+    "fields, error",
+    [
+        ({"stop_times": []}, "U: no stop_times"),
+        (
+            {
+                "frequencies": [
+                    {"start_time": "08:00", "end_time": "09:00", "headway_secs": 0}
+                ]
+            },
+            "U: headway_secs 0 is not positive",
+        ),
+    ],
+)
+def test_pattern_that_cannot_run_is_listed(fields, error):
+    expanded = ExpandedTrips([{**PATTERN, "trip_id": "U", **fields}, PATTERN])
+    assert [t["trip_id"] for t in expanded.trips] == ["T"]
+    assert expanded.errors == [error]
+    assert len(list(expanded.runs())) == 1
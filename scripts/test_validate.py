@@ -0,0 +1,68 @@
+import copy
+
+import pytest
+
+import gen_gtfs
+import validate
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """gen_gtfs with fresh tables, so a test can change TRIP_PATTERNS."""
+    patterns = copy.deepcopy(gen_gtfs.TRIP_PATTERNS)
+    monkeypatch.setattr(gen_gtfs, "TRIP_PATTERNS", patterns)
+    monkeypatch.setattr(gen_gtfs, "FILES", gen_gtfs.LazyTables(gen_gtfs.FILES._builders))
+    caches = (
+        gen_gtfs.expanded_trips,
+        gen_gtfs._legacy_trips,
+        gen_gtfs._pattern_stop_distances,
+    )
+    for cached in caches:
+        cached.cache_clear()
+    yield gen_gtfs
+    for cached in caches:
+        cached.cache_clear()
+
+
+def test_feed_is_valid(feed):
+    report = validate.validate(feed.FILES)
+    assert report["valid"], report["issues"]
+
+
+def test_unknown_stop_is_reported(feed):
+    time, _ = feed.TRIP_PATTERNS[0]["stop_times"][1]
+    feed.TRIP_PATTERNS[0]["stop_times"][1] = (time, "STOP-bogus")
+    report = validate.validate(feed.FILES)
+    assert not report["valid"]
+    messages = [found["message"] for found in report["issues"]]
+    assert any("STOP-bogus" in message for message in messages), messages
+    assert not any("no stop_times" in message for message in messages), messages
+
+
+def test_build_refuses_unknown_stop(feed, tmp_path):
+    time, _ = feed.TRIP_PATTERNS[0]["stop_times"][1]
+    feed.TRIP_PATTERNS[0]["stop_times"][1] = (time, "STOP-bogus")
+    output = tmp_path / "feed.zip"
+    assert feed.main(["-o", str(output), "--no-cache", "--no-sidecar"]) == 1
+    assert not output.exists()
+
+
+@pytest.mark.parametrize(
+    "time, message",
+    [("9:3", "malformed time '9:3'"), ("08:00", "arrival before the previous stop")],
+)
+def test_bad_pattern_time_is_reported(feed, tmp_path, time, message):
+    _, stop_id = feed.TRIP_PATTERNS[0]["stop_times"][1]
+    feed.TRIP_PATTERNS[0]["stop_times"][1] = (time, stop_id)
+    report = validate.validate(feed.FILES, feed.build_errors())
+    assert not report["valid"]
+    assert any(message in found["message"] for found in report["issues"])
+    output = tmp_path / "feed.zip"
+    assert feed.main(["-o", str(output), "--no-cache", "--no-sidecar"]) == 1
+
+
+def test_validation_streams_large_tables(feed):
+    report = validate.validate(feed.FILES)
+    assert report["rows"]["stop_times.txt"] > 0
+    assert not feed.FILES.is_built("stop_times.txt")
+    assert not feed.FILES.is_built("shapes.txt")
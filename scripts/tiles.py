@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""Pre-tiled, multi-resolution route geometry for map.html.
+
+Each zoom band gets its own simplification of the shapes in scripts/shapes/
+and is cut into XYZ tiles at one tile zoom, written as small GeoJSON files
+that Jekyll serves as-is. manifest.json lists the bands and the tiles that
+hold data, so the page only requests tiles in view at the current band.
+
+    python tiles.py            # all routes
+    python tiles.py --routes WCC
+"""
+
+import json
+import math
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import gen_gtfs
+from simplify import simplify
+
+tiles_dir = Path(gen_gtfs.script_dir).parent / "tiles"
+
+# Zoom bands: map zooms they serve, the zoom their tiles are cut at, and how
+# far the simplified line may stray (about a pixel at the band's low end)
+BANDS = [
+    {"minzoom": 0, "maxzoom": 8, "tile_zoom": 6, "tolerance_m": 250, "decimals": 3},
+    {"minzoom": 9, "maxzoom": 11, "tile_zoom": 9, "tolerance_m": 40, "decimals": 4},
+    {"minzoom": 12, "maxzoom": 19, "tile_zoom": 11, "tolerance_m": 4, "decimals": 5},
+]
+
+# Routes whose towns are named on the map at every zoom, as before it was tiled
+LABELLED_ROUTES = {gen_gtfs.WEST_COASTAL_CONNECTION_ID}
+
+
+def tile_coords(lonlat, z):
+    """Fractional XYZ tile coordinates of lon/lat degrees at zoom z."""
+    n = 2**z
+    lat = np.radians(lonlat[:, 1])
+    x = (lonlat[:, 0] + 180) / 360 * n
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * n
+    return np.column_stack((x, y))
+
+
+def cut(lonlat, z):
+    """Split a line into per-tile runs: {(x, y): [array of lon/lat, ...]}.
+
+    A run holds every segment whose bounding box touches the tile, so it may
+    reach a little past the tile edge; neighbouring tiles overlap exactly.
+    """
+    txy = tile_coords(lonlat, z)
+    low = np.floor(np.minimum(txy[:-1], txy[1:])).astype(int)
+    high = np.floor(np.maximum(txy[:-1], txy[1:])).astype(int)
+
+    segments = {}
+    for i, ((x0, y0), (x1, y1)) in enumerate(zip(low, high)):
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                segments.setdefault((x, y), []).append(i)
+
+    runs = {}
+    for key, seg in segments.items():
+        seg = np.array(seg)
+        breaks = np.flatnonzero(np.diff(seg) != 1) + 1
+        runs[key] = [
+            lonlat[part[0] : part[-1] + 2] for part in np.split(seg, breaks)
+        ]
+    return runs
+
+
+def route_shapes(route_ids=None):
+    """The first shape of each route, in TRIP_PATTERNS order, as (route_id, shape_id)."""
+    seen = {}
+    for trip in gen_gtfs.TRIP_PATTERNS:
+        if route_ids and trip["route_id"] not in route_ids:
+            continue
+        if "shape_id" in trip:
+            seen.setdefault(trip["route_id"], trip["shape_id"])
+    return list(seen.items())
+
+
+def route_stops(route_ids=None):
+    """Point features for the towns the routes stop in, one per stop_name.
+
+    Towns on LABELLED_ROUTES have "label" set, for map.html to name them at
+    every zoom; the map only names the others once zoomed in.
+    """
+    served, labelled = set(), set()
+    for trip in gen_gtfs.TRIP_PATTERNS:
+        if route_ids and trip["route_id"] not in route_ids:
+            continue
+        stop_ids = {stop_id for _, stop_id in trip["stop_times"]}
+        served |= stop_ids
+        if trip["route_id"] in LABELLED_ROUTES:
+            labelled |= stop_ids
+    labelled = {s["stop_name"] for s in gen_gtfs.STOPS if s["stop_id"] in labelled}
+    features = {}
+    for stop in gen_gtfs.STOPS:
+        if stop["stop_id"] in served:
+            features.setdefault(
+                stop["stop_name"],
+                {
+                    "type": "Feature",
+                    "properties": {
+                        "name": stop["stop_name"],
+                        "label": stop["stop_name"] in labelled,
+                    },
+                    "geometry": {
+                        "type": "Point",
+                        "coordinates": [stop["stop_lon"], stop["stop_lat"]],
+                    },
+                },
+            )
+    return {"type": "FeatureCollection", "features": list(features.values())}
+
+
+def _dump(value, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(value, separators=(",", ":")) + "\n")
+
+
+def clear(output):
+    """Remove what an earlier build wrote to output, going by its manifest.
+
+    Anything else in output is left alone. A non-empty directory without a
+    manifest was not written here, so it is refused rather than emptied.
+    """
+    manifest_path = output / "manifest.json"
+    if not manifest_path.exists():
+        if output.exists() and any(output.iterdir()):
+            raise FileExistsError(f"{output}: not empty and has no manifest.json")
+        return
+    manifest = json.loads(manifest_path.read_text())
+    for band in manifest["bands"]:
+        shutil.rmtree(output / str(band["tile_zoom"]), ignore_errors=True)
+    (output / manifest["stops"]).unlink(missing_ok=True)
+    manifest_path.unlink()
+
+
+def build(output=tiles_dir, route_ids=None):
+    """Write the tiles, stops and manifest under output; returns the manifest."""
+    shapes = [
+        (route_id, shape_id, np.array(gen_gtfs._coords(gen_gtfs.shape_path(shape_id))))
+        for route_id, shape_id in route_shapes(route_ids)
+    ]
+    routes = {route["route_id"]: route for route in gen_gtfs.ROUTES}
+
+    # Tiles from an earlier build may no longer have data
+    clear(output)
+
+    manifest = {"stops": "stops.geojson", "bands": []}
+    for band in BANDS:
+        z = band["tile_zoom"]
+        tiles = {}
+        for route_id, shape_id, lonlat in shapes:
+            line, _ = simplify(lonlat, band["tolerance_m"], band["decimals"])
+            for key, runs in cut(line, z).items():
+                tiles.setdefault(key, []).extend(
+                    {
+                        "type": "Feature",
+                        "properties": {
+                            "route_id": route_id,
+                            "shape_id": shape_id,
+                            "name": routes[route_id]["route_long_name"],
+                        },
+                        "geometry": {"type": "LineString", "coordinates": run.tolist()},
+                    }
+                    for run in runs
+                )
+        for (x, y), features in sorted(tiles.items()):
+            _dump(
+                {"type": "FeatureCollection", "features": features},
+                output / str(z) / str(x) / f"{y}.geojson",
+            )
+        manifest["bands"].append(
+            {**band, "tiles": [f"{x}/{y}" for x, y in sorted(tiles)]}
+        )
+
+    _dump(route_stops(route_ids), output / manifest["stops"])
+    _dump(manifest, output / "manifest.json")
+    return manifest
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write map tiles of the routes.")
+    parser.add_argument("-o", "--output", type=Path, default=tiles_dir)
+    parser.add_argument("--routes", nargs="+", metavar="ROUTE_ID")
+    args = parser.parse_args(argv)
+
+    try:
+        manifest = build(args.output, args.routes)
+    except FileExistsError as e:
+        print(f"{e}, not written", file=sys.stderr)
+        return 1
+    for band in manifest["bands"]:
+        print(
+            f"zoom {band['minzoom']}-{band['maxzoom']}: "
+            f"{len(band['tiles'])} tiles at z{band['tile_zoom']}",
+            file=sys.stderr,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
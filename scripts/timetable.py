@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+"""Next departures from a stop, answered from precomputed per-stop arrays.
+
+Every stop keeps its departures sorted as seconds since midnight, so a
+query is a binary search followed by a service-calendar check per
+candidate.
+
+    python timetable.py STOP-477b3ace-4389-47e8-a4c7-cb32cd874a10 -n 3
+"""
+
+import heapq
+import itertools
+import json
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from trip_patterns import parse_time
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def seconds_to_time(seconds):
+    """Seconds since midnight as "HH:MM:SS"."""
+    h, rest = divmod(int(seconds), 3600)
+    return f"{h:02}:{rest // 60:02}:{rest % 60:02}"
+
+
+class Timetable:
+    """Per-stop departure index over a list of trips in the TRIPS format."""
+
+    def __init__(self, trips, routes, stops, service_calendar):
+        self.calendar = service_calendar
+        self.trips = trips
+        self.routes = {route["route_id"]: route for route in routes}
+        self.stop_names = {stop["stop_id"]: stop["stop_name"] for stop in stops}
+
+        self.trip_stops = [[stop_id for _, stop_id in t["stop_times"]] for t in trips]
+        self.trip_times = [
+            np.array([parse_time(time) for time, _ in t["stop_times"]], np.int32)
+            for t in trips
+        ]
+
+        # One entry per (trip, stop) visit, grouped by stop and sorted by time
+        stop_ids = np.array([s for stops_ in self.trip_stops for s in stops_])
+        times = np.concatenate(self.trip_times)
+        lengths = [len(s) for s in self.trip_stops]
+        trip_index = np.repeat(np.arange(len(trips), dtype=np.int32), lengths)
+        position = np.concatenate([np.arange(n, dtype=np.int32) for n in lengths])
+        # A trip's last stop is where it arrives, not a departure
+        departs = position < np.repeat(np.array(lengths, dtype=np.int32) - 1, lengths)
+        stop_ids, times = stop_ids[departs], times[departs]
+        trip_index, position = trip_index[departs], position[departs]
+        order = np.lexsort((times, stop_ids))
+        unique, first = np.unique(stop_ids[order], return_index=True)
+        bounds = np.append(first, len(order))
+
+        self._departures = {}
+        for i, stop_id in enumerate(unique):
+            visits = order[bounds[i] : bounds[i + 1]]
+            self._departures[str(stop_id)] = (
+                times[visits],
+                trip_index[visits],
+                position[visits],
+            )
+        self._latest = int(times.max()) if len(times) else 0
+
+        # Which trips run on each day of the feed window, as (trips, days)
+        service_rows = [service_calendar.service_ids.index(t["service_id"]) for t in trips]
+        self._runs = service_calendar.matrix()[service_rows]
+        self._first_ordinal = service_calendar.start.astype(object).toordinal()
+
+    def next_departures(self, stop_id, when, n=5, days=31):
+        """The next n departures from stop_id at or after the datetime when.
+
+        Looks up to days service days ahead, so services running once a month
+        are still found. Each departure lists the later stops of its trip.
+        """
+        midnight = datetime(when.year, when.month, when.day)
+        seconds = (when - midnight).seconds
+
+        # Trips from the previous service day still running after midnight
+        starts = itertools.chain(
+            [(midnight - timedelta(days=1), seconds + SECONDS_PER_DAY)]
+            if seconds + SECONDS_PER_DAY <= self._latest
+            else [],
+            [(midnight, seconds)],
+            ((midnight + timedelta(days=d), 0) for d in range(1, days)),
+        )
+        # Times past 24:00 overlap the next day, so the days are merged by clock
+        merged = heapq.merge(
+            *(self._day_departures(stop_id, day, s) for day, s in starts)
+        )
+        times, trip_index, position = self._departures.get(stop_id, ((), (), ()))
+        return [
+            self._departure(day, int(times[i]), trip_index[i], position[i])
+            for _, day, i in itertools.islice(merged, n)
+        ]
+
+    def _day_departures(self, stop_id, service_day, from_seconds):
+        """(departure, service day, visit) from stop_id on one day, in time order."""
+        offset = service_day.toordinal() - self._first_ordinal
+        if not 0 <= offset < self._runs.shape[1]:
+            # Outside the feed window
+            return
+        times, trip_index, _ = self._departures.get(stop_id, ((), (), ()))
+        for i in range(np.searchsorted(times, from_seconds), len(times)):
+            if self._runs[trip_index[i], offset]:
+                yield service_day + timedelta(seconds=int(times[i])), service_day, i
+
+    def _departure(self, day, time, trip, position):
+        t = self.trips[trip]
+        route = self.routes[t["route_id"]]
+        stops = self.trip_stops[trip]
+        times = self.trip_times[trip]
+        return {
+            "trip_id": t["trip_id"],
+            "route_id": t["route_id"],
+            "route_name": route.get("route_short_name") or route["route_long_name"],
+            "direction_id": t["direction_id"],
+            "headsign": t.get("trip_headsign") or self.stop_names.get(stops[-1]),
+            "departure": day + timedelta(seconds=time),
+            "later_stops": [
+                {
+                    "stop_id": stop_id,
+                    "stop_name": self.stop_names.get(stop_id),
+                    "arrival": day + timedelta(seconds=int(arrival)),
+                }
+                for stop_id, arrival in zip(
+                    stops[position + 1 :], times[position + 1 :]
+                )
+            ],
+        }
+
+
+def load():
+    """Timetable of the feed defined in gen_gtfs."""
+    import gen_gtfs
+
+    return Timetable(
+        gen_gtfs.TRIPS, gen_gtfs.ROUTES, gen_gtfs.STOPS, gen_gtfs.service_calendar()
+    )
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the next departures from a stop.")
+    parser.add_argument("stop_id")
+    parser.add_argument(
+        "--when",
+        type=datetime.fromisoformat,
+        default=datetime.now(),
+        help="local date and time, e.g. 2025-09-02T08:00 (default: now)",
+    )
+    parser.add_argument("-n", type=int, default=5, help="number of departures")
+    args = parser.parse_args(argv)
+
+    departures = load().next_departures(args.stop_id, args.when, args.n)
+    print(json.dumps(departures, indent=2, default=datetime.isoformat))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
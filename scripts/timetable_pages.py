@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+"""Static timetable fragments for every stop and route, rendered from the feed.
+
+Each fragment is a self-contained piece of HTML with its CSS inlined, written
+to timetables/ under a name ending in a hash of its content, so Jekyll can
+serve it as-is and browsers can cache it for good. manifest.json maps each
+stop_id and route_id to its current file, along with a digest of the trips,
+stops, routes and calendar it was rendered from; a fragment whose inputs are
+unchanged is not rendered again.
+
+    python timetable_pages.py
+    python timetable_pages.py --force    # re-render everything
+"""
+
+import hashlib
+import html
+import json
+import sys
+from pathlib import Path
+
+import gen_gtfs
+from build_cache import value_digest
+from service_calendar import WEEKDAYS, to_yyyymmdd
+from trip_patterns import parse_time
+
+pages_dir = Path(gen_gtfs.script_dir).parent / "timetables"
+
+# Bump when the markup changes, so every fragment is rendered again
+PAGES_VERSION = 1
+
+STYLE = (
+    "<style>"
+    ".tt{font-family:Arial,sans-serif;font-size:14px}"
+    ".tt table{border-collapse:collapse;margin:0 0 1em}"
+    ".tt th,.tt td{border:1px solid #bbb;padding:2px 6px;text-align:left}"
+    ".tt thead th{background:#eee}"
+    ".tt td.t{text-align:right;white-space:nowrap}"
+    "</style>"
+)
+
+MONTHS = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+
+
+def format_time(seconds):
+    """Seconds since midnight as e.g. "9:30 AM", marking times past midnight."""
+    h, m = seconds // 3600, seconds // 60 % 60
+    text = f"{(h % 12) or 12}:{m:02} {'AM' if h % 24 < 12 else 'PM'}"
+    return text + " (next day)" if h >= 24 else text
+
+
+def format_date(yyyymmdd, year=True):
+    y, m, d = yyyymmdd // 10000, yyyymmdd // 100 % 100, yyyymmdd % 100
+    return f"{MONTHS[m - 1]} {d}, {y}" if year else f"{MONTHS[m - 1]} {d}"
+
+
+def format_dates(days):
+    """YYYYMMDD days grouped by year, e.g. "2025: Aug 6, Sep 3; 2026: Jan 7"."""
+    years = {}
+    for day in days:
+        years.setdefault(day // 10000, []).append(format_date(day, year=False))
+    return "; ".join(f"{y}: {', '.join(d)}" for y, d in years.items())
+
+
+def service_label(service_id):
+    """When a service runs, in words, from calendar.txt and calendar_dates.txt."""
+    calendar = {row["service_id"]: row for row in gen_gtfs.CALENDAR}
+    exceptions = [r for r in gen_gtfs.CALENDAR_DATES if r["service_id"] == service_id]
+    if service_id not in calendar:
+        return "Only on " + format_dates(
+            to_yyyymmdd(gen_gtfs.service_calendar().dates(service_id)).tolist()
+        )
+
+    row = calendar[service_id]
+    days = [d for d in WEEKDAYS if row[d] == gen_gtfs.ServiceAvailable.YES.value]
+    if len(days) == 7:
+        label = "Daily"
+    elif days == WEEKDAYS[:5]:
+        label = "Monday to Friday"
+    elif days == WEEKDAYS[5:]:
+        label = "Weekends"
+    else:
+        label = ", ".join(f"{d.title()}s" for d in days)
+    if (row["start_date"], row["end_date"]) != (gen_gtfs.FEED_START, gen_gtfs.FEED_END):
+        label += (
+            f", {format_date(row['start_date'])} to {format_date(row['end_date'])}"
+        )
+    added, removed = gen_gtfs.ServiceException.ADDED, gen_gtfs.ServiceException.REMOVED
+    for exception_type, words in ((added.value, "also on"), (removed.value, "not on")):
+        dates = [r["date"] for r in exceptions if r["exception_type"] == exception_type]
+        if dates:
+            label += f"; {words} {format_dates(sorted(dates))}"
+    return label
+
+
+class Model:
+    """The trips, stops, routes and services the fragments are rendered from."""
+
+    def __init__(self):
+        self.trips = gen_gtfs.TRIPS
+        self.routes = {route["route_id"]: route for route in gen_gtfs.ROUTES}
+        self.stops = {stop["stop_id"]: stop for stop in gen_gtfs.STOPS}
+        self.services = {
+            service_id: service_label(service_id)
+            for service_id in dict.fromkeys(t["service_id"] for t in self.trips)
+        }
+        self.stop_trips, self.route_trips = {}, {}
+        for trip in self.trips:
+            self.route_trips.setdefault(trip["route_id"], []).append(trip)
+            for stop_id in dict.fromkeys(s for _, s in trip["stop_times"]):
+                self.stop_trips.setdefault(stop_id, []).append(trip)
+
+    def route_name(self, route_id):
+        route = self.routes[route_id]
+        return route.get("route_short_name") or route["route_long_name"]
+
+    def stop_name(self, stop_id):
+        return self.stops[stop_id]["stop_name"]
+
+    def inputs(self, trips, stop_ids=()):
+        """Digest of everything a fragment showing trips depends on."""
+        return value_digest(
+            [
+                PAGES_VERSION,
+                trips,
+                [self.routes[t["route_id"]] for t in trips],
+                {
+                    s: self.stop_name(s)
+                    for t in trips
+                    for s in [*stop_ids, *(s for _, s in t["stop_times"])]
+                },
+                {t["service_id"]: self.services[t["service_id"]] for t in trips},
+            ]
+        )
+
+
+def _by_service(trips, services):
+    groups = {}
+    for trip in trips:
+        groups.setdefault(trip["service_id"], []).append(trip)
+    return [(services[s], groups[s]) for s in services if s in groups]
+
+
+def render_stop(model, stop_id):
+    """Departures from one stop, a table per service."""
+    e = html.escape
+    parts = [f'<section class="tt">{STYLE}<h3>{e(model.stop_name(stop_id))}</h3>']
+    for label, trips in _by_service(model.stop_trips[stop_id], model.services):
+        rows = []
+        for trip in trips:
+            stop_times = trip["stop_times"]
+            for i, (time, s) in enumerate(stop_times):
+                if s != stop_id:
+                    continue
+                towards = (
+                    f"To {model.stop_name(stop_times[-1][1])}"
+                    if i < len(stop_times) - 1
+                    else "Arrives, terminates here"
+                )
+                route = model.route_name(trip["route_id"])
+                rows.append((parse_time(time), route, towards))
+        parts.append(
+            f"<h4>{e(label)}</h4><table><thead><tr>"
+            "<th>Time</th><th>Route</th><th>Towards</th></tr></thead><tbody>"
+        )
+        parts.extend(
+            f'<tr><td class="t">{format_time(t)}</td><td>{e(route)}</td>'
+            f"<td>{e(towards)}</td></tr>"
+            for t, route, towards in sorted(rows)
+        )
+        parts.append("</tbody></table>")
+    parts.append("</section>\n")
+    return "".join(parts)
+
+
+def render_route(model, route_id):
+    """A grid of stops by trips for each direction and service of one route."""
+    e = html.escape
+    route = model.routes[route_id]
+    parts = [f'<section class="tt">{STYLE}<h3>{e(route["route_long_name"])}</h3>']
+    directions = {}
+    for trip in model.route_trips[route_id]:
+        directions.setdefault(trip.get("direction_id"), []).append(trip)
+    for _, trips in sorted(directions.items(), key=lambda item: str(item[0])):
+        for label, group in _by_service(trips, model.services):
+            group = sorted(group, key=lambda t: parse_time(t["stop_times"][0][0]))
+            stop_ids = list(dict.fromkeys(s for t in group for _, s in t["stop_times"]))
+            times = [dict((s, time) for time, s in t["stop_times"]) for t in group]
+            parts.append(
+                f"<h4>To {e(model.stop_name(group[0]['stop_times'][-1][1]))}"
+                f" &middot; {e(label)}</h4><table><tbody>"
+            )
+            for stop_id in stop_ids:
+                cells = "".join(
+                    '<td class="t">'
+                    + (
+                        format_time(parse_time(t[stop_id]))
+                        if stop_id in t
+                        else "&ndash;"
+                    )
+                    + "</td>"
+                    for t in times
+                )
+                parts.append(
+                    f'<tr><th scope="row">{e(model.stop_name(stop_id))}</th>{cells}</tr>'
+                )
+            parts.append("</tbody></table>")
+    parts.append("</section>\n")
+    return "".join(parts)
+
+
+def _content_name(prefix, text):
+    return f"{prefix}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}.html"
+
+
+def build(output=pages_dir, force=False):
+    """Render changed fragments under output; returns (manifest, rendered count)."""
+    manifest_path = output / "manifest.json"
+    previous = {"stops": {}, "routes": {}}
+    if manifest_path.exists() and not force:
+        previous = json.loads(manifest_path.read_text())
+
+    model = Model()
+    kinds = {
+        "stops": (model.stop_trips, render_stop),
+        "routes": (model.route_trips, render_route),
+    }
+    manifest, rendered = {}, 0
+    for kind, (trips_of, render) in kinds.items():
+        manifest[kind] = {}
+        for key, trips in trips_of.items():
+            inputs = model.inputs(trips, [key] if kind == "stops" else [])
+            entry = previous.get(kind, {}).get(key)
+            if entry and entry["inputs"] == inputs and (output / entry["file"]).exists():
+                manifest[kind][key] = entry
+                continue
+            text = render(model, key)
+            name = f"{kind}/{_content_name(key, text)}"
+            path = output / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text, encoding="utf-8")
+            manifest[kind][key] = {"file": name, "inputs": inputs}
+            rendered += 1
+
+    # Fragments no longer in the manifest are stale
+    current = {entry["file"] for entries in manifest.values() for entry in entries.values()}
+    for path in output.glob("*/*.html"):
+        if path.relative_to(output).as_posix() not in current:
+            path.unlink()
+
+    manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True) + "\n")
+    return manifest, rendered
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render static timetable fragments.")
+    parser.add_argument("-o", "--output", type=Path, default=pages_dir)
+    parser.add_argument("--force", action="store_true", help="re-render every fragment")
+    args = parser.parse_args(argv)
+
+    manifest, rendered = build(args.output, args.force)
+    total = sum(len(entries) for entries in manifest.values())
+    print(f"{args.output}: {rendered} of {total} fragments rendered", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Expand trip patterns into trips and stop_times arrays.
+
+A pattern is a trip in the TRIPS format whose stop_times give the stop
+order and the times of one run. Every other run keeps the same running
+times, so a pattern expands to its trips with one broadcast of start times
+against offsets. Times are integer seconds until they are written.
+
+Besides the trip fields, a pattern may have:
+    "starts"       departure times of every run; trip_ids get a "-HHMM" suffix
+    "frequencies"  frequencies.txt windows ({"start_time", "end_time",
+                   "headway_secs", optional "exact_times"}) for one trip
+Without either, the pattern is a single trip run at its stop_times.
+
+A pattern whose times cannot be read, or that has no stops or a headway
+that is not positive, is left out and listed in errors so that validation
+reports it; times that go back are left for validation to find in
+stop_times.txt.
+"""
+
+import re
+
+import numpy as np
+
+PATTERN_KEYS = ("stop_times", "starts", "frequencies")
+
+# H:MM or HH:MM, optionally with :SS; hours may pass 24 for trips after midnight
+_TIME = re.compile(r"(\d{1,2}):([0-5]\d)(?::([0-5]\d))?")
+
+
+def parse_time(value):
+    """Seconds since midnight of a time string, rejecting malformed ones."""
+    match = _TIME.fullmatch(value)
+    if match is None:
+        raise ValueError(f"malformed time {value!r}")
+    h, m, s = match.groups(default="0")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def format_times(seconds):
+    """Array of seconds since midnight as a list of "HH:MM:SS" strings."""
+    seconds = np.asarray(seconds)
+    # A timetable repeats a small set of times; format each one once
+    unique, inverse = np.unique(seconds, return_inverse=True)
+    h, rest = np.divmod(unique, 3600)
+    m, s = np.divmod(rest, 60)
+    text = np.array(
+        [f"{h:02}:{m:02}:{s:02}" for h, m, s in zip(h.tolist(), m.tolist(), s.tolist())],
+        dtype=object,
+    )
+    return text[inverse.reshape(-1)].tolist()
+
+
+def _run_suffix(seconds):
+    return f"{seconds // 3600:02}{seconds // 60 % 60:02}"
+
+
+def _read_times(pattern):
+    """Seconds of a pattern's stop times, its run starts or None, and its windows."""
+    if not pattern["stop_times"]:
+        raise ValueError("no stop_times")
+    times = np.array([parse_time(t) for t, _ in pattern["stop_times"]])
+    if "starts" in pattern and "frequencies" in pattern:
+        raise ValueError("give starts or frequencies, not both")
+    starts = None
+    if "starts" in pattern:
+        starts = np.array(sorted(parse_time(t) for t in pattern["starts"]))
+    windows = [
+        {
+            "start_time": parse_time(window["start_time"]),
+            "end_time": parse_time(window["end_time"]),
+            "headway_secs": window["headway_secs"],
+            "exact_times": window.get("exact_times", ""),
+        }
+        for window in pattern.get("frequencies", ())
+    ]
+    for window in windows:
+        if window["headway_secs"] <= 0:
+            raise ValueError(f"headway_secs {window['headway_secs']} is not positive")
+    return times, starts, windows
+
+
+class ExpandedTrips:
+    """Trips of a list of patterns, with their stop_times as parallel arrays.
+
+    trips        trip rows without stop_times, in pattern then start order
+    trip_pattern pattern index of each trip
+    stop_ids     stop_id of every pattern stop, patterns concatenated
+    pattern_base index in stop_ids of each pattern's first stop
+    stop_times   {"trip", "stop_sequence", "time", "pattern_stop"} int32
+                 arrays, one entry per row of stop_times.txt; pattern_stop
+                 indexes stop_ids
+    frequencies  rows of frequencies.txt, times in seconds
+    errors       "trip_id: problem" for every pattern left out
+    """
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.trips = []
+        self.stop_ids = []
+        self.frequencies = []
+        self.errors = []
+        trip_pattern, pattern_base, columns = [], [], []
+
+        for p, pattern in enumerate(patterns):
+            trip_id = pattern["trip_id"]
+            base = len(self.stop_ids)
+            self.stop_ids.extend(stop_id for _, stop_id in pattern["stop_times"])
+            pattern_base.append(base)
+            try:
+                times, starts, windows = _read_times(pattern)
+            except ValueError as e:
+                self.errors.append(f"{trip_id}: {e}")
+                continue
+            fields = {k: v for k, v in pattern.items() if k not in PATTERN_KEYS}
+            offsets = times - times[0]
+            if starts is None:
+                starts, trip_ids = times[:1], [trip_id]
+            else:
+                trip_ids = [f"{trip_id}-{_run_suffix(s)}" for s in starts.tolist()]
+            self.frequencies.extend({"trip_id": trip_id, **w} for w in windows)
+
+            first_trip = len(self.trips)
+            self.trips.extend({**fields, "trip_id": t} for t in trip_ids)
+            trip_pattern.extend([p] * len(trip_ids))
+
+            # (runs, stops) blocks, flattened run by run
+            n_runs, n_stops = len(starts), len(offsets)
+            columns.append(
+                (
+                    np.repeat(np.arange(first_trip, first_trip + n_runs), n_stops),
+                    np.tile(np.arange(n_stops), n_runs),
+                    (starts[:, None] + offsets[None, :]).ravel(),
+                    np.tile(np.arange(base, base + n_stops), n_runs),
+                )
+            )
+
+        self.trip_pattern = np.array(trip_pattern, dtype=np.int32)
+        self.pattern_base = np.array(pattern_base, dtype=np.int32)
+        names = ("trip", "stop_sequence", "time", "pattern_stop")
+        self.stop_times = {
+            name: (
+                np.concatenate([c[i] for c in columns]).astype(np.int32)
+                if columns
+                else np.zeros(0, dtype=np.int32)
+            )
+            for i, name in enumerate(names)
+        }
+
+    def pattern_stops(self, p):
+        """Slice of stop_ids holding pattern p's stops."""
+        base = self.pattern_base[p]
+        return slice(base, base + len(self.patterns[p]["stop_times"]))
+
+    def runs(self):
+        """Every run as (trip, pattern, start seconds), frequency windows included.
+
+        A trip with frequencies runs once per headway in each window, so this
+        may give several runs of one trip.
+        """
+        starts = self.stop_times["time"][self.stop_times["stop_sequence"] == 0]
+        windows = {}
+        for row in self.frequencies:
+            windows.setdefault(row["trip_id"], []).append(row)
+        for trip, (row, p, start) in enumerate(
+            zip(self.trips, self.trip_pattern.tolist(), starts.tolist())
+        ):
+            if row["trip_id"] not in windows:
+                yield trip, p, start
+                continue
+            for window in windows[row["trip_id"]]:
+                for s in range(
+                    window["start_time"], window["end_time"], window["headway_secs"]
+                ):
+                    yield trip, p, s
+
+    def legacy_trips(self):
+        """Runs as trips in the TRIPS format, with ("HH:MM:SS", stop_id) stop_times.
+
+        Each run of a frequency-based trip is a trip of its own, its trip_id
+        given a "-HHMM" suffix like the runs of "starts"; feed_trip_id keeps
+        the trip_id it has in trips.txt.
+        """
+        offsets = {}
+        frequency_trips = {row["trip_id"] for row in self.frequencies}
+        result = []
+        for trip, p, start in self.runs():
+            if p not in offsets:
+                times = [parse_time(t) for t, _ in self.patterns[p]["stop_times"]]
+                offsets[p] = np.array(times) - times[0]
+            stops = self.stop_ids[self.pattern_stops(p)]
+            times = format_times(start + offsets[p])
+            row = {**self.trips[trip], "stop_times": list(zip(times, stops))}
+            if row["trip_id"] in frequency_trips:
+                row["feed_trip_id"] = row["trip_id"]
+                row["trip_id"] = f"{row['trip_id']}-{_run_suffix(start)}"
+            result.append(row)
+        return result
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+
+"""Checks of a feed's tables, run on the tables before writing.
+
+Each table is streamed once into arrays of the columns the checks use, so
+no table is held in memory as rows. IDs are factorized into integer codes
+or looked up with np.isin, so every check is a few array operations over
+all rows rather than a loop per row. Issues come back as dicts, ready to
+be written as a JSON report.
+
+    python validate.py                   # the tables defined in gen_gtfs
+    python validate.py ../west_gtfs.zip --report report.json
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+
+from service_calendar import WEEKDAYS, ServiceCalendar, to_day, to_yyyymmdd
+from simplify import line_distances, project
+from trip_patterns import parse_time
+
+ERROR = "error"
+WARNING = "warning"
+
+# Stops further than this from the shape of a trip serving them are reported
+MAX_SHAPE_OFFSET_M = 100
+
+# Row indices listed per issue
+MAX_ROWS = 10
+
+# (table, column, referenced tables, referenced column)
+REFERENCES = [
+    ("routes.txt", "agency_id", ("agency.txt",), "agency_id"),
+    ("trips.txt", "route_id", ("routes.txt",), "route_id"),
+    ("trips.txt", "service_id", ("calendar.txt", "calendar_dates.txt"), "service_id"),
+    ("trips.txt", "shape_id", ("shapes.txt",), "shape_id"),
+    ("stop_times.txt", "trip_id", ("trips.txt",), "trip_id"),
+    ("stop_times.txt", "stop_id", ("stops.txt",), "stop_id"),
+    ("frequencies.txt", "trip_id", ("trips.txt",), "trip_id"),
+]
+
+PRIMARY_KEYS = {
+    "agency.txt": "agency_id",
+    "stops.txt": "stop_id",
+    "routes.txt": "route_id",
+    "trips.txt": "trip_id",
+}
+
+
+def lookup(keys, values):
+    """Row in keys of each of values, -1 where a value is not a key."""
+    if not len(keys):
+        return np.full(len(values), -1)
+    order = np.argsort(keys, kind="stable")
+    at = np.minimum(np.searchsorted(keys, values, sorter=order), len(keys) - 1)
+    rows = order[at]
+    return np.where(keys[rows] == values, rows, -1)
+
+
+def issue(severity, check, table, message, rows=()):
+    """One entry of the report; rows index the table's rows, 0 being the first."""
+    rows = np.asarray(rows, dtype=np.int64)
+    return {
+        "severity": severity,
+        "check": check,
+        "table": table,
+        "message": message,
+        "count": max(len(rows), 1),
+        "rows": rows[:MAX_ROWS].tolist(),
+    }
+
+
+# Columns read from each table, with their types; the checks use no others
+COLUMNS = {
+    "agency.txt": {"agency_id": str},
+    "stops.txt": {"stop_id": str, "stop_lon": float, "stop_lat": float},
+    "routes.txt": {"route_id": str, "agency_id": str},
+    "trips.txt": {"trip_id": str, "route_id": str, "service_id": str, "shape_id": str},
+    "stop_times.txt": {
+        "trip_id": str,
+        "arrival_time": str,
+        "departure_time": str,
+        "stop_id": str,
+        "stop_sequence": float,
+        "shape_dist_traveled": float,
+    },
+    "calendar.txt": {
+        "service_id": str,
+        **{day: str for day in WEEKDAYS},
+        "start_date": str,
+        "end_date": str,
+    },
+    "calendar_dates.txt": {"service_id": str, "date": str, "exception_type": str},
+    "feed_info.txt": {"feed_start_date": str, "feed_end_date": str},
+    "shapes.txt": {
+        "shape_id": str,
+        "shape_pt_lon": float,
+        "shape_pt_lat": float,
+        "shape_pt_sequence": float,
+    },
+    "frequencies.txt": {"trip_id": str},
+}
+
+# Rows converted into arrays at a time while a table is read
+CHUNK_ROWS = 1 << 16
+
+
+def _array(values, dtype):
+    if dtype is float:
+        values = [np.nan if v in ("", None) else v for v in values]
+    return np.array(values, dtype=dtype).reshape(-1)
+
+
+class Feed:
+    """Column arrays of a feed's tables, each read in one pass on first use.
+
+    Rows come from tables.iter_rows() where it exists, so a lazy table is
+    streamed rather than built and kept.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.build_issues = []
+        self.counts = {}
+        self._columns = {}
+
+    def _rows(self, table):
+        iter_rows = getattr(self.tables, "iter_rows", None)
+        return iter_rows(table) if iter_rows else iter(self.tables[table])
+
+    def _read(self, table):
+        types = COLUMNS.get(table, {})
+        chunks = {name: [] for name in types}
+        pending = {name: [] for name in types}
+        count = 0
+
+        def flush():
+            for name, values in pending.items():
+                chunks[name].append(_array(values, types[name]))
+                values.clear()
+
+        if table in self.tables:
+            try:
+                for count, row in enumerate(self._rows(table), start=1):
+                    for name, values in pending.items():
+                        values.append(row.get(name, ""))
+                    if count % CHUNK_ROWS == 0:
+                        flush()
+            except (KeyError, ValueError) as e:
+                message = f"could not be built: {type(e).__name__}: {e}"
+                self.build_issues.append(issue(ERROR, "build", table, message))
+                chunks, pending, count = {name: [] for name in types}, {}, 0
+        flush()
+        self.counts[table] = count
+        for name, parts in chunks.items():
+            self._columns[table, name] = (
+                np.concatenate(parts) if parts else _array([], types[name])
+            )
+
+    def count(self, table):
+        """Rows in a table; 0 if it is missing or could not be built."""
+        if table not in self.counts:
+            self._read(table)
+        return self.counts[table]
+
+    def column(self, table, name):
+        """A column of COLUMNS as an array; missing values are "" or, for floats, nan."""
+        self.count(table)
+        return self._columns[table, name]
+
+    def records(self, table):
+        """The rows of a small table as dicts of its COLUMNS."""
+        names = list(COLUMNS[table])
+        columns = [self.column(table, name).tolist() for name in names]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def seconds(self, table, name):
+        """A time column as (seconds since midnight, zero-padded) arrays.
+
+        Seconds are nan where the time is empty or malformed.
+        """
+        times = self.column(table, name)
+        unique, inverse = np.unique(times, return_inverse=True)
+        # Timetables repeat a small set of times; parse each one once
+        seconds, padded = np.full(len(unique), np.nan), np.ones(len(unique), bool)
+        for i, text in enumerate(unique.tolist()):
+            # GTFS times are HH:MM:SS; H:MM:SS is accepted but reported
+            if text.count(":") != 2:
+                continue
+            try:
+                seconds[i] = parse_time(text)
+            except ValueError:
+                continue
+            padded[i] = text.index(":") >= 2
+        inverse = inverse.reshape(-1)
+        return seconds[inverse], padded[inverse]
+
+
+def check_keys(feed):
+    issues = []
+    for table, key in PRIMARY_KEYS.items():
+        ids = feed.column(table, key)
+        repeated = np.ones(len(ids), dtype=bool)
+        repeated[np.unique(ids, return_index=True)[1]] = False
+        for mask, message in ((ids == "", "missing"), (repeated, "duplicate")):
+            if mask.any():
+                issues.append(
+                    issue(ERROR, "keys", table, f"{message} {key}", np.flatnonzero(mask))
+                )
+    return issues
+
+
+def check_references(feed):
+    issues = []
+    for table, column, targets, target_column in REFERENCES:
+        values = feed.column(table, column)
+        keys = np.concatenate([feed.column(t, target_column) for t in targets])
+        rows = np.flatnonzero((values != "") & ~np.isin(values, keys))
+        if len(rows):
+            missing = sorted(set(values[rows].tolist()))[:MAX_ROWS]
+            issues.append(
+                issue(
+                    ERROR,
+                    "references",
+                    table,
+                    f"{column} not in {' or '.join(targets)}: {', '.join(missing)}",
+                    rows,
+                )
+            )
+
+    trip_ids = feed.column("trips.txt", "trip_id")
+    rows = np.flatnonzero(~np.isin(trip_ids, feed.column("stop_times.txt", "trip_id")))
+    if len(rows):
+        issues.append(
+            issue(ERROR, "references", "trips.txt", "trip has no stop_times", rows)
+        )
+    return issues
+
+
+def check_times(feed):
+    """Time format, and times, sequences and distances increasing along each trip."""
+    issues = []
+    table = "stop_times.txt"
+    seconds = {}
+    for name in ("arrival_time", "departure_time"):
+        text = feed.column(table, name)
+        seconds[name], padded = feed.seconds(table, name)
+        for mask, severity, message in (
+            ((text != "") & np.isnan(seconds[name]), ERROR, "malformed"),
+            (~padded, WARNING, "not zero-padded"),
+        ):
+            rows = np.flatnonzero(mask)
+            if len(rows):
+                examples = ", ".join(sorted(set(text[rows].tolist()))[:MAX_ROWS])
+                issues.append(
+                    issue(
+                        severity,
+                        "time_format",
+                        table,
+                        f"{name} {message}: {examples}",
+                        rows,
+                    )
+                )
+
+    trip_ids = feed.column(table, "trip_id")
+    if not len(trip_ids):
+        return issues
+
+    # Rows sorted by trip, then stop_sequence
+    trip = np.unique(trip_ids, return_inverse=True)[1].reshape(-1)
+    sequence = feed.column(table, "stop_sequence")
+    order = np.lexsort((sequence, trip))
+    trip, sequence = trip[order], sequence[order]
+    arrival = seconds["arrival_time"][order]
+    departure = seconds["departure_time"][order]
+    distance = feed.column(table, "shape_dist_traveled")[order]
+    empty_arrival = feed.column(table, "arrival_time")[order] == ""
+    empty_departure = feed.column(table, "departure_time")[order] == ""
+
+    first = np.ones(len(trip), dtype=bool)
+    first[1:] = trip[1:] != trip[:-1]
+    last = np.roll(first, -1)
+    # Each row compared with the row before it in the same trip
+    follows = ~first
+    previous_departure = np.roll(departure, 1)
+    previous_sequence = np.roll(sequence, 1)
+    previous_distance = np.roll(distance, 1)
+
+    for mask, severity, message in (
+        (
+            (first | last) & (empty_arrival | empty_departure),
+            ERROR,
+            "first and last stop of a trip need arrival and departure times",
+        ),
+        (departure < arrival, ERROR, "departure before arrival"),
+        (
+            follows & (sequence == previous_sequence),
+            ERROR,
+            "stop_sequence repeated within a trip",
+        ),
+        (
+            follows & (arrival < previous_departure),
+            ERROR,
+            "arrival before the previous stop's departure",
+        ),
+        (
+            follows & (distance < previous_distance),
+            WARNING,
+            "shape_dist_traveled decreases along a trip",
+        ),
+    ):
+        if mask.any():
+            rows = np.sort(order[mask])
+            issues.append(issue(severity, "stop_order", table, message, rows))
+    return issues
+
+
+def _int_rows(rows, columns):
+    return [{k: (int(v) if k in columns else v) for k, v in row.items()} for row in rows]
+
+
+def check_calendar(feed):
+    """Every service with trips runs in the feed window, and service runs daily."""
+    issues = []
+    calendar = _int_rows(
+        feed.records("calendar.txt"), set(WEEKDAYS) | {"start_date", "end_date"}
+    )
+    calendar_dates = _int_rows(
+        feed.records("calendar_dates.txt"), {"date", "exception_type"}
+    )
+    info = feed.records("feed_info.txt")
+    if info and info[0]["feed_start_date"] and info[0]["feed_end_date"]:
+        start, end = int(info[0]["feed_start_date"]), int(info[0]["feed_end_date"])
+    else:
+        dates = [r[k] for r in calendar for k in ("start_date", "end_date")]
+        dates += [r["date"] for r in calendar_dates]
+        if not dates:
+            return [issue(ERROR, "calendar", "calendar.txt", "no service dates")]
+        start, end = min(dates), max(dates)
+
+    services = ServiceCalendar(calendar, calendar_dates, start, end)
+    active = services.matrix()
+    service_ids = feed.column("trips.txt", "service_id")
+    used = np.isin(services.service_ids, service_ids)
+
+    for i in np.flatnonzero(used & ~active.any(axis=1)).tolist():
+        service_id = services.service_ids[i]
+        issues.append(
+            issue(
+                ERROR,
+                "calendar",
+                "trips.txt",
+                f"service {service_id} never runs between {start} and {end}",
+                np.flatnonzero(service_ids == service_id),
+            )
+        )
+
+    unused = [s for s, u in zip(services.service_ids, used) if not u]
+    if unused:
+        issues.append(
+            issue(
+                WARNING,
+                "calendar",
+                "calendar.txt",
+                f"services without trips: {', '.join(unused)}",
+            )
+        )
+
+    idle_days = services.days[~active[used].any(axis=0)]
+    if len(idle_days):
+        dates = ", ".join(map(str, to_yyyymmdd(idle_days[:MAX_ROWS]).tolist()))
+        issues.append(
+            issue(
+                WARNING,
+                "calendar",
+                "calendar.txt",
+                f"{len(idle_days)} days without service: {dates}",
+            )
+        )
+
+    for i, row in enumerate(calendar):
+        if (
+            to_day(row["start_date"]) < services.start
+            or to_day(row["end_date"]) > services.end
+        ):
+            issues.append(
+                issue(
+                    WARNING,
+                    "calendar",
+                    "calendar.txt",
+                    f"service {row['service_id']} extends past the feed window",
+                    [i],
+                )
+            )
+    return issues
+
+
+def _offsets(line, points):
+    """Distance in metres from each point to the nearest segment of line."""
+    lat0 = line[:, 1].mean()
+    return line_distances(project(points, lat0), project(line, lat0))
+
+
+def check_stops(feed):
+    """Stop coordinates, and how far each stop is from the shapes of its trips."""
+    issues = []
+    stop_ids = feed.column("stops.txt", "stop_id")
+    lonlat = np.column_stack(
+        (
+            feed.column("stops.txt", "stop_lon"),
+            feed.column("stops.txt", "stop_lat"),
+        )
+    )
+    lon, lat = lonlat.T
+    bad = ~((np.abs(lat) <= 90) & (np.abs(lon) <= 180)) | ((lat == 0) & (lon == 0))
+    if bad.any():
+        issues.append(
+            issue(
+                ERROR,
+                "coordinates",
+                "stops.txt",
+                "invalid stop coordinates",
+                np.flatnonzero(bad),
+            )
+        )
+
+    # The shape of every stop_times row, through its trip
+    trip = lookup(
+        feed.column("trips.txt", "trip_id"), feed.column("stop_times.txt", "trip_id")
+    )
+    shape = np.where(trip >= 0, feed.column("trips.txt", "shape_id")[trip], "")
+    stop = feed.column("stop_times.txt", "stop_id")
+    keep = (shape != "") & (lookup(stop_ids, stop) >= 0)
+    if not keep.any():
+        return issues
+    pairs = np.unique(np.column_stack((shape[keep], stop[keep])), axis=0)
+
+    # Shape points grouped by shape_id, in sequence order. Rows of a shape come
+    # in runs, so only the first ID of each run is compared as a string
+    shape_ids = feed.column("shapes.txt", "shape_id")
+    run_starts = np.flatnonzero(np.append(True, shape_ids[1:] != shape_ids[:-1]))
+    names, run_shape = np.unique(shape_ids[run_starts], return_inverse=True)
+    row_shape = np.repeat(
+        run_shape.reshape(-1), np.diff(np.append(run_starts, len(shape_ids)))
+    )
+    order = np.lexsort((feed.column("shapes.txt", "shape_pt_sequence"), row_shape))
+    points = np.column_stack(
+        (
+            feed.column("shapes.txt", "shape_pt_lon")[order],
+            feed.column("shapes.txt", "shape_pt_lat")[order],
+        )
+    )
+    starts = np.searchsorted(row_shape[order], np.arange(len(names)))
+    ends = np.append(starts[1:], len(order))
+
+    pair_shapes, first = np.unique(pairs[:, 0], return_index=True)
+    for shape_id, lo, hi in zip(pair_shapes, first, np.append(first[1:], len(pairs))):
+        at = lookup(names, [shape_id])[0]
+        if at < 0:
+            continue
+        rows = lookup(stop_ids, pairs[lo:hi, 1])
+        offsets = _offsets(points[starts[at] : ends[at]], lonlat[rows])
+        for row, metres in zip(rows.tolist(), offsets.tolist()):
+            if metres > MAX_SHAPE_OFFSET_M:
+                issues.append(
+                    issue(
+                        WARNING,
+                        "shape_distance",
+                        "stops.txt",
+                        f"stop {stop_ids[row]} is {metres:.0f} m from shape {shape_id}",
+                        [row],
+                    )
+                )
+    return issues
+
+
+CHECKS = [check_keys, check_references, check_times, check_calendar, check_stops]
+
+
+def validate(tables, build_errors=()):
+    """Run every check on tables, a mapping of GTFS file names to row dicts.
+
+    build_errors are (table, message) pairs of problems met while building
+    the tables, reported as errors alongside those the checks find.
+    """
+    feed = Feed(tables)
+    issues = [found for check in CHECKS for found in check(feed)]
+    built = [issue(ERROR, "build", table, message) for table, message in build_errors]
+    issues = built + feed.build_issues + issues
+    errors = sum(found["severity"] == ERROR for found in issues)
+    return {
+        "valid": errors == 0,
+        "errors": errors,
+        "warnings": len(issues) - errors,
+        "rows": {table: feed.count(table) for table in tables},
+        "issues": issues,
+    }
+
+
+def print_issues(report, file=sys.stderr):
+    for found in report["issues"]:
+        print(f"{found['severity']}: {found['table']}: {found['message']}", file=file)
+
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check a GTFS feed.")
+    parser.add_argument(
+        "zip_path", nargs="?", help="feed to check (default: the tables in gen_gtfs)"
+    )
+    parser.add_argument("--report", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.zip_path:
+        from feed_reader import FeedReader
+
+        with FeedReader(args.zip_path) as feed:
+            report = validate({name: feed[name] for name in feed})
+    else:
+        import gen_gtfs
+
+        report = validate(gen_gtfs.FILES, gen_gtfs.build_errors())
+    elapsed = time.perf_counter() - started
+
+    print_issues(report)
+    print(
+        f"{report['errors']} errors, {report['warnings']} warnings "
+        f"in {elapsed * 1000:.1f} ms",
+        file=sys.stderr,
+    )
+    if args.report:
+        write_report(report, args.report)
+    return 0 if report["valid"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())